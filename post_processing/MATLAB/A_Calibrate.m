@@ -1,6 +1,6 @@
 % STOKECAM Post-Processing
 % Drew Davey
-% Last updated: 2024-10-10
+% Last updated: 2026-10-17
 
 clear; clc; close all;
 
@@ -57,5 +57,6 @@ displayErrors(estimationErrors, stereoParams);
 
 %% Save mat
 save([calib_path '/full_calibration.mat']);
+export_calib_cv(stereoParams, [calib_path '/calib_cv.mat']); % for the Python tools
 clearvars -except stereoParams calib_path h1 h2
 save([calib_path '/calib.mat']);
@@ -0,0 +1,20 @@
+% STOKECAM Post-Processing
+% Drew Davey
+% Last updated: 2026-10-17
+
+% Function to save stereoParams as plain OpenCV-convention matrices for the Python tools (batch_rectify.py)
+% Camera 1 is cam1 and camera 2 is cam0, as in A_Calibrate.m
+function export_calib_cv(stereoParams, fname)
+    c1 = stereoParams.CameraParameters1;
+    c2 = stereoParams.CameraParameters2;
+    K1 = c1.IntrinsicMatrix'; % OpenCV uses the transpose of MATLAB's IntrinsicMatrix
+    K2 = c2.IntrinsicMatrix';
+    K1(1:2,3) = K1(1:2,3) - 1;              % MATLAB pixel coordinates are 1-based, OpenCV's 0-based
+    K2(1:2,3) = K2(1:2,3) - 1;              % (as stereoParametersToOpenCV)
+    D1 = [c1.RadialDistortion(1:2) c1.TangentialDistortion c1.RadialDistortion(3:end)]; % [k1 k2 p1 p2 k3]
+    D2 = [c2.RadialDistortion(1:2) c2.TangentialDistortion c2.RadialDistortion(3:end)];
+    R = stereoParams.RotationOfCamera2';    % Row-vector convention -> column-vector convention
+    T = stereoParams.TranslationOfCamera2'; % millimeters
+    imageSize = c1.ImageSize;               % [rows cols]
+    save(fname, 'K1', 'D1', 'K2', 'D2', 'R', 'T', 'imageSize');
+end
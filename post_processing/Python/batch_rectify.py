@@ -0,0 +1,160 @@
+# Last updated: 2026-10-17
+##################################
+# Batch rectification + disparity for one or more sessions (Python/OpenCV counterpart of B_Rectify.m).
+# The calibration is loaded once; the initUndistortRectifyMap tables and Q are cached next to it, keyed by calibration
+# hash and image size. Frame pairs (from session_index.py) are streamed through BM/SGBM in a process pool.
+# Each disparity map is written atomically to <session>/disparity/<HHMMSS>_<imageNum>.png, so an interrupted run
+# resumes where it stopped. PNGs are 16-bit: disparity = value/16 + DisparityRange(1) - 1, value 0 = invalid.
+# With use_store = 1 the maps go into the session's compressed recon_store.ReconStore instead.
+# Usage:
+#   python batch_rectify.py <calib_cv.mat | calib.npz> <session_dir> [<session_dir> ...]
+##################################
+import os
+import sys
+import time
+import hashlib
+import cv2
+import numpy as np
+from multiprocessing import Pool
+from session_index import SessionIndex
+from recon_store import ReconStore
+
+## Inputs (as in B_Rectify.m)
+BM_SGBM = 0                     # semi-global block matching (0) or block matching (1)
+DisparityRange = [0, 64]
+BlockSize = 11
+UniquenessThreshold = 15
+use_store = 0                   # write disparity to <session>/recon (1) or to 16-bit PNGs (0)
+nworkers = os.cpu_count()
+
+calib_keys = ('K1', 'D1', 'K2', 'D2', 'R', 'T')
+
+# Function to load a calibration (calib_cv.mat from export_calib_cv.m, or .npz with the same fields)
+def load_calib(fname):
+    if fname.endswith('.mat'):
+        from scipy.io import loadmat
+        m = loadmat(fname)
+    else:
+        m = np.load(fname)
+    calib = {k: np.ascontiguousarray(m[k], dtype=np.float64) for k in calib_keys}
+    calib['D1'], calib['D2'] = calib['D1'].ravel(), calib['D2'].ravel()
+    calib['T'] = calib['T'].reshape(3, 1)
+    calib['imageSize'] = tuple(int(v) for v in np.ravel(m['imageSize']))   # (rows, cols)
+    return calib
+
+def calib_hash(calib):
+    h = hashlib.sha1()
+    [h.update(calib[k].tobytes()) for k in calib_keys]
+    return h.hexdigest()[:12]
+
+# Function to get the rectification maps and Q for an image size (w, h), computing and caching them if needed
+def rect_maps(calib, size, cache_dir):
+    fname = os.path.join(cache_dir, f"rectmaps_{calib_hash(calib)}_{size[0]}x{size[1]}.npz")
+    if not os.path.exists(fname):
+        R1, R2, P1, P2, Q, roi1, roi2 = cv2.stereoRectify(calib['K1'], calib['D1'], calib['K2'], calib['D2'], size,
+                                                          calib['R'], calib['T'], flags=cv2.CALIB_ZERO_DISPARITY, alpha=0)
+        m1x, m1y = cv2.initUndistortRectifyMap(calib['K1'], calib['D1'], R1, P1, size, cv2.CV_16SC2)
+        m2x, m2y = cv2.initUndistortRectifyMap(calib['K2'], calib['D2'], R2, P2, size, cv2.CV_16SC2)
+        os.makedirs(cache_dir, exist_ok=True)
+        with open(fname + '.tmp', 'wb') as f:
+            np.savez(f, m1x=m1x, m1y=m1y, m2x=m2x, m2y=m2y, Q=Q, P1=P1, P2=P2, roi1=roi1, roi2=roi2)
+        os.replace(fname + '.tmp', fname)
+    return fname
+
+def create_matcher():
+    nd = -(-(DisparityRange[1] - DisparityRange[0]) // 16) * 16        # Multiple of 16
+    if BM_SGBM:
+        matcher = cv2.StereoBM_create(numDisparities=nd, blockSize=BlockSize)
+        matcher.setMinDisparity(DisparityRange[0])
+        matcher.setUniquenessRatio(UniquenessThreshold)
+        return matcher
+    return cv2.StereoSGBM_create(minDisparity=DisparityRange[0], numDisparities=nd, blockSize=BlockSize,
+                                 P1=8 * BlockSize ** 2, P2=32 * BlockSize ** 2, uniquenessRatio=UniquenessThreshold)
+
+# Function to encode an OpenCV fixed-point (x16) disparity map as the 16-bit PNG values described above
+def disparity_to_png(disp16):
+    return np.clip(disp16.astype(np.int32) - (DisparityRange[0] - 1) * 16, 0, 65535).astype(np.uint16)
+
+def png_to_disparity(png):
+    d = png.astype(np.float32) / 16 + DisparityRange[0] - 1
+    d[png == 0] = np.nan
+    return d
+
+# Per-worker state: the maps and matcher are loaded once per process
+_maps = None
+_matcher = None
+
+def _init(fname_maps):
+    global _maps, _matcher
+    _maps = dict(np.load(fname_maps))
+    _matcher = create_matcher()
+    cv2.setNumThreads(1)                        # Parallelism comes from the pool
+
+def rectify_pair(left, right, maps):
+    J1 = cv2.remap(left, maps['m1x'], maps['m1y'], cv2.INTER_LINEAR)
+    J2 = cv2.remap(right, maps['m2x'], maps['m2y'], cv2.INTER_LINEAR)
+    return J1, J2
+
+def _process(task):
+    left_path, right_path, out_path, pair = task
+    t0 = time.time()
+    J1, J2 = rectify_pair(cv2.imread(left_path, cv2.IMREAD_GRAYSCALE), cv2.imread(right_path, cv2.IMREAD_GRAYSCALE), _maps)
+    disp16 = _matcher.compute(J1, J2)
+    if out_path is None:
+        return os.getpid(), time.time() - t0, pair, disp16     # Stored by the parent process
+    cv2.imwrite(out_path + '.tmp.png', disparity_to_png(disp16))
+    os.replace(out_path + '.tmp.png', out_path)  # Only finished frames ever appear under their real name
+    return os.getpid(), time.time() - t0, pair, None
+
+# Function to list the (left, right, output, pair) tasks still to do for a session. cam1 is left, as in B_Rectify.m.
+def session_tasks(session, out_dir, store=None):
+    index = SessionIndex(session)
+    index.refresh()
+    tasks = []
+    for pair in index.pairs():
+        image_num, t, name0, name1 = pair
+        if store is not None:
+            out_path = None
+            if name1 in store:
+                continue
+        else:
+            out_path = os.path.join(out_dir, f"{name1.split('_')[1][:6]}_{image_num:05}.png")
+            if os.path.exists(out_path):
+                continue
+        tasks.append((os.path.join(session, 'cam1', name1), os.path.join(session, 'cam0', name0), out_path, pair))
+    npairs = index.count_pairs()
+    index.close()
+    return tasks, npairs
+
+def run_sessions(fname_calib, sessions):
+    calib = load_calib(fname_calib)
+    cache_dir = os.path.join(os.path.dirname(os.path.abspath(fname_calib)), 'rectmaps')
+    rows, cols = calib['imageSize']
+    fname_maps = rect_maps(calib, (cols, rows), cache_dir)
+    Q = np.load(fname_maps)['Q']
+    with Pool(nworkers, initializer=_init, initargs=(fname_maps,)) as pool:
+        for session in sessions:
+            out_dir = os.path.join(session, 'disparity')
+            os.makedirs(out_dir, exist_ok=True)
+            np.savetxt(os.path.join(out_dir, 'Q.txt'), Q)
+            store = ReconStore(session, Q, (rows, cols), DisparityRange, fname_maps, mode='a') if use_store else None
+            tasks, npairs = session_tasks(session, out_dir, store)
+            print(f"{session}: {len(tasks)} of {npairs} pairs to do")
+            stats = {}
+            t0 = time.time()
+            # In order (tasks are in time order), so the store's frame index k stays in time order
+            for pid, dt, pair, disp16 in pool.imap(_process, tasks, chunksize=4):
+                n, busy = stats.get(pid, (0, 0.0))
+                stats[pid] = (n + 1, busy + dt)
+                if store is not None:
+                    store.append(*pair, disp16)
+            if store is not None:
+                store.close()
+            elapsed = time.time() - t0
+            if tasks:
+                print(f"    {len(tasks) / elapsed:.2f} frames/s total")
+                for pid, (n, busy) in sorted(stats.items()):
+                    print(f"    worker {pid}: {n} frames, {n / busy:.2f} frames/s")
+
+if __name__ == '__main__':
+    run_sessions(sys.argv[1], sys.argv[2:])
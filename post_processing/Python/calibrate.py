@@ -0,0 +1,149 @@
+# Last updated: 2026-10-17
+##################################
+# Stereo calibration from a calib_<mode> session (Python/OpenCV counterpart of A_Calibrate.m).
+# Checkerboard corners are detected in a process pool and cached per image in <session>/corners/<sha1 of file>.npy,
+# so a rerun only detects new or changed frames. Pairs come from session_index.py (cam1 is camera 1, as in
+# A_Calibrate.m). Each calibration starts from the previous one; pairs whose reprojection error is far above the median
+# are rejected and the rest recalibrated. Per-pair errors go to calib_report.csv.
+# Outputs in the session: calib_cv.mat and calib_cv.npz (same fields as export_calib_cv.m), and the rectification maps
+# in rectmaps/ exactly as batch_rectify.py caches them, so batch_rectify.py and warm_disparity.py load them directly.
+# With --watch, the session is polled and recalibrated as frames arrive (e.g. while master.py:calib is running).
+# Usage:
+#   python calibrate.py <calib_session_dir> [--watch]
+##################################
+import os
+import sys
+import time
+import hashlib
+import cv2
+import numpy as np
+from multiprocessing import Pool
+from session_index import SessionIndex
+from batch_rectify import rect_maps
+
+## Inputs
+squareSize = 45                 # in units of 'millimeters'
+pattern_size = (9, 6)           # inner corners of the checkerboard (cols, rows)
+max_error_ratio = 3             # reject pairs whose reprojection error is above this x the median
+min_error_reject = 0.5          # ... and above this (px)
+min_pairs = 5                   # pairs needed before calibrating
+watch_dt = 5                    # poll interval for --watch (s)
+nworkers = os.cpu_count()
+
+report_header = 'image_num,name0,name1,err1,err2,used'
+
+def file_hash(path):
+    with open(path, 'rb') as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+# Function to detect the checkerboard corners of one image: (hash, Nx2 float32 corners or empty, image size (w, h))
+def _detect(task):
+    path, h = task
+    img = cv2.imread(path, cv2.IMREAD_GRAYSCALE)
+    ok, corners = cv2.findChessboardCornersSB(img, pattern_size, flags=cv2.CALIB_CB_EXHAUSTIVE | cv2.CALIB_CB_ACCURACY)
+    corners = corners.reshape(-1, 2).astype(np.float32) if ok else np.empty((0, 2), np.float32)
+    return h, corners, (img.shape[1], img.shape[0])
+
+# Function to get the corners of every frame of a session, detecting only images that are not in the cache
+def detect_session(session, pool):
+    cache_dir = os.path.join(session, 'corners')
+    os.makedirs(cache_dir, exist_ok=True)
+    hashes, todo = {}, []
+    for cam in ('cam0', 'cam1'):
+        for e in os.scandir(os.path.join(session, cam)):
+            if e.name.endswith('.jpg'):
+                h = hashes[e.name] = file_hash(e.path)
+                if not os.path.exists(os.path.join(cache_dir, h + '.npy')):
+                    todo.append((e.path, h))
+    size = None
+    for h, corners, size in pool.imap_unordered(_detect, todo):
+        np.save(os.path.join(cache_dir, h + '.tmp.npy'), corners)
+        os.replace(os.path.join(cache_dir, h + '.tmp.npy'), os.path.join(cache_dir, h + '.npy'))
+    corners = {name: np.load(os.path.join(cache_dir, h + '.npy')) for name, h in hashes.items()}
+    return corners, len(todo), size
+
+def object_points():
+    grid = np.zeros((pattern_size[0] * pattern_size[1], 3), np.float32)
+    grid[:, :2] = np.mgrid[0:pattern_size[0], 0:pattern_size[1]].T.reshape(-1, 2) * squareSize
+    return grid
+
+# Function to calibrate from the given pairs of corners, starting from a previous calibration if there is one.
+# Returns the calibration dict (as load_calib) and the per-pair errors (N x 2, camera 1 and 2).
+def stereo_calibrate(c1, c2, size, prev=None):
+    obj = [object_points()] * len(c1)
+    flags = cv2.CALIB_USE_INTRINSIC_GUESS if prev is not None else 0
+    K1, D1 = (prev['K1'].copy(), prev['D1'].copy()) if prev is not None else (None, None)
+    K2, D2 = (prev['K2'].copy(), prev['D2'].copy()) if prev is not None else (None, None)
+    if prev is None:                            # Intrinsics of each camera first, as a starting point
+        _, K1, D1, _, _ = cv2.calibrateCamera(obj, c1, size, None, None)
+        _, K2, D2, _, _ = cv2.calibrateCamera(obj, c2, size, None, None)
+        flags = cv2.CALIB_USE_INTRINSIC_GUESS
+    criteria = (cv2.TERM_CRITERIA_COUNT + cv2.TERM_CRITERIA_EPS, 100, 1e-6)
+    rms, K1, D1, K2, D2, R, T, E, F, rvecs, tvecs, errs = cv2.stereoCalibrateExtended(
+        obj, c1, c2, K1, D1, K2, D2, size, np.eye(3), np.zeros((3, 1)), flags=flags, criteria=criteria)
+    calib = {'K1': K1, 'D1': D1.ravel(), 'K2': K2, 'D2': D2.ravel(), 'R': R, 'T': T.reshape(3, 1),
+             'imageSize': (size[1], size[0]), 'rms': rms}
+    return calib, errs.reshape(-1, 2)
+
+# Function to calibrate with outlier rejection. Returns the calibration, a used flag and the errors per pair.
+def calibrate_pairs(c1, c2, size, prev=None):
+    used = np.ones(len(c1), bool)
+    allerrs = np.full((len(c1), 2), np.nan)     # Rejected pairs keep their error from when they were rejected
+    while True:
+        idx = np.flatnonzero(used)
+        calib, errs = stereo_calibrate([c1[i] for i in idx], [c2[i] for i in idx], size, prev)
+        allerrs[idx] = errs
+        e = errs.max(axis=1)
+        bad = e > max(max_error_ratio * np.median(e), min_error_reject)
+        if not bad.any() or used.sum() - bad.sum() < min_pairs:
+            break
+        used[idx[bad]] = False
+        prev = calib
+    return calib, used, allerrs
+
+# Function to keep the corner order of a camera 2 view consistent with camera 1 (the detector may flip a board by 180)
+def match_order(p1, p2):
+    return p2[::-1].copy() if np.dot(p1[-1] - p1[0], p2[-1] - p2[0]) < 0 else p2
+
+def save_calib(session, calib):
+    from scipy.io import savemat
+    fields = {k: calib[k] for k in ('K1', 'D1', 'K2', 'D2', 'R', 'T')}
+    fields['imageSize'] = np.array(calib['imageSize'], dtype=np.float64)      # [rows cols]
+    savemat(os.path.join(session, 'calib_cv.mat'), fields)
+    np.savez(os.path.join(session, 'calib_cv.npz'), **fields)
+    rows, cols = calib['imageSize']
+    return rect_maps(calib, (cols, rows), os.path.join(session, 'rectmaps'))
+
+def calibrate_session(session, pool, prev=None):
+    corners, ndetected, size = detect_session(session, pool)
+    index = SessionIndex(session)
+    index.refresh()
+    pairs = [p for p in index.pairs() if len(corners.get(p[3], ())) and len(corners.get(p[2], ()))]
+    index.close()
+    if size is None:
+        size = cv2.imread(os.path.join(session, 'cam1', pairs[0][3])).shape[1::-1] if pairs else None
+    print(f"{session}: {ndetected} new images detected, {len(pairs)} pairs with the board in both cameras")
+    if len(pairs) < min_pairs:
+        return prev
+    c1 = [corners[name1] for image_num, t, name0, name1 in pairs]
+    c2 = [match_order(corners[name1], corners[name0]) for image_num, t, name0, name1 in pairs]
+    calib, used, errs = calibrate_pairs(c1, c2, size, prev)
+    with open(os.path.join(session, 'calib_report.csv'), 'w') as f:
+        f.write(report_header + '\n')
+        f.writelines(f"{p[0]},{p[2]},{p[3]},{e[0]:.4f},{e[1]:.4f},{int(u)}\n" for p, e, u in zip(pairs, errs, used))
+    fname_maps = save_calib(session, calib)
+    print(f"    rms {calib['rms']:.3f} px from {used.sum()} pairs ({(~used).sum()} rejected), "
+          f"baseline {np.linalg.norm(calib['T']):.1f} mm, maps in {fname_maps}")
+    return calib
+
+if __name__ == '__main__':
+    session = sys.argv[1]
+    with Pool(nworkers) as pool:
+        calib = calibrate_session(session, pool)
+        while '--watch' in sys.argv[2:]:
+            time.sleep(watch_dt)
+            index = SessionIndex(session)
+            nframes, npairs = index.refresh()
+            index.close()
+            if npairs:
+                calib = calibrate_session(session, pool, calib)
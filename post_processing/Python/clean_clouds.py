@@ -0,0 +1,155 @@
+# Last updated: 2026-10-17
+##################################
+# Automatic point-cloud cleaning for a whole session (batch counterpart of C_CleanPtClouds.m).
+# For every frame in <session>/recon (recon_store.py): bounds trim, sparse-voxel removal at binSize, KD-tree statistical
+# (as pcdenoise) and radius outlier removal, and a temporal check that drops points whose voxel is empty in both
+# neighbouring frames in time (splash). Neighbours are the previous and next frames by time, used only within
+# maxNeighbourGap frame intervals (dt, the median spacing), so frames are never compared across burst boundaries. Frames are processed in a process pool, a few at a time per task to bound memory.
+# Removed points are stored as a new edit (mask) of each frame; per-frame stats go to recon/clean_stats.csv, and only
+# frames flagged there as anomalous need a manual look.
+# Usage:
+#   python clean_clouds.py <session_dir>
+##################################
+import os
+import sys
+import numpy as np
+from multiprocessing import Pool
+from scipy.spatial import cKDTree
+from recon_store import ReconStore
+
+## Inputs (as in C_CleanPtClouds.m)
+bounds = [-10, 10, -10, 10, 0, 20]  # [xmin xmax ymin ymax zmin zmax] for trimming points (meters)
+binSize = 1                         # size of the cubic bin for voxel binning (meters)
+minBinPoints = 10                   # voxels with fewer points are removed
+NumNeighbors = 4                    # statistical outlier removal (pcdenoise defaults)
+Threshold = 1.0                     # ... std devs above the mean neighbour distance
+radius = 0.05                       # radius outlier removal (meters)
+minRadiusPoints = 3                 # ... min neighbours within radius
+temporalBin = 0.25                  # voxel size for the temporal consistency check (meters)
+maxNeighbourGap = 2                 # ... neighbours further apart in time than this many frame intervals are not used
+flagMAD = 3                         # flag frames whose kept fraction is this many MADs from the session median
+framesPerTask = 8
+nworkers = os.cpu_count()
+
+stats_header = 'k,image_num,n_valid,n_bounds,n_voxel,n_sor,n_radius,n_kept,kept_frac,flagged'    # points left after each step
+
+# Function to get integer voxel keys for points at a given bin size
+def voxel_keys(pts, size):
+    v = np.floor(pts / size).astype(np.int64)
+    v -= v.min(axis=0) if len(v) else 0
+    dims = v.max(axis=0) + 1 if len(v) else np.ones(3, np.int64)
+    return np.ravel_multi_index(v.T, dims), v, dims
+
+def trim_bounds(pts):
+    return ((pts[:, 0] >= bounds[0]) & (pts[:, 0] <= bounds[1]) & (pts[:, 1] >= bounds[2]) & (pts[:, 1] <= bounds[3]) &
+            (pts[:, 2] >= bounds[4]) & (pts[:, 2] <= bounds[5]))
+
+def sparse_voxels(pts):
+    keys, _, _ = voxel_keys(pts, binSize)
+    _, inv, counts = np.unique(keys, return_inverse=True, return_counts=True)
+    return counts[inv] >= minBinPoints
+
+def statistical_outliers(tree, pts):
+    d, _ = tree.query(pts, k=NumNeighbors + 1, workers=1)
+    mean_d = d[:, 1:].mean(axis=1)
+    return mean_d <= mean_d.mean() + Threshold * mean_d.std()
+
+def radius_outliers(tree, pts):
+    counts = tree.query_ball_point(pts, radius, return_length=True, workers=1)
+    return counts - 1 >= minRadiusPoints
+
+# Function to get one int64 key per point for an absolute temporalBin grid (21 bits per axis), so frames are comparable
+def temporal_keys(pts):
+    v = np.floor(pts / temporalBin).astype(np.int64) + (1 << 20)
+    return (v[:, 0] << 42) | (v[:, 1] << 21) | v[:, 2]
+
+# Function to get the occupied temporal voxels of a frame
+def occupied(pts):
+    return np.unique(temporal_keys(pts))
+
+def temporal_keep(pts, neighbours):
+    if not neighbours:
+        return np.ones(len(pts), bool)
+    keys = temporal_keys(pts)
+    return np.any([np.isin(keys, occ) for occ in neighbours], axis=0)
+
+# Function to clean one frame given its points and its neighbours' occupied voxels.
+# Returns the keep mask and the number of points left after each step.
+def clean_points(pts, neighbours):
+    idx = np.flatnonzero(np.isfinite(pts).all(axis=1))
+    n = [len(idx)]
+    idx = idx[trim_bounds(pts[idx])]
+    n.append(len(idx))
+    idx = idx[sparse_voxels(pts[idx])]
+    n.append(len(idx))
+    if len(idx) > NumNeighbors:
+        tree = cKDTree(pts[idx])
+        sor = statistical_outliers(tree, pts[idx])
+        rad = radius_outliers(tree, pts[idx])
+        n.append(int(sor.sum()))
+        idx = idx[sor & rad]
+    else:
+        n.append(len(idx))
+    n.append(len(idx))
+    idx = idx[temporal_keep(pts[idx], neighbours)]
+    n.append(len(idx))
+    keep = np.zeros(len(pts), bool)
+    keep[idx] = True
+    return keep, n
+
+# Function to get each frame's temporal neighbours: {k: [previous and next frame by time, within maxNeighbourGap * dt]}
+def time_neighbours(store):
+    t = np.array([f[1] for f in store.frames], dtype=float)
+    order = np.argsort(t, kind='stable')
+    gap = np.diff(t[order])
+    dt = np.median(gap[gap > 0]) if (gap > 0).any() else 0
+    neighbours = {int(k): [] for k in order}
+    for a, b, g in zip(order[:-1], order[1:], gap):
+        if g <= maxNeighbourGap * dt:
+            neighbours[int(a)].append(int(b))
+            neighbours[int(b)].append(int(a))
+    return [int(k) for k in order], neighbours
+
+def _clean_task(args):
+    session, ks, neighbours = args
+    store = ReconStore(session)
+    pts, pix, occ = {}, {}, {}
+    for k in sorted(set(ks).union(*neighbours.values())):
+        pts[k], pix[k] = store.points(k, version=0)
+        ok = np.isfinite(pts[k]).all(axis=1)
+        occ[k] = occupied(pts[k][ok & trim_bounds(np.nan_to_num(pts[k]))])
+    out = []
+    for k in ks:
+        keep, n = clean_points(pts[k], [occ[j] for j in neighbours[k]])
+        removed = np.zeros(store.size, bool)
+        removed[pix[k][0][~keep], pix[k][1][~keep]] = True
+        out.append((k, np.packbits(removed, axis=-1), n))
+    return out
+
+def clean_session(session):
+    store = ReconStore(session)
+    order, neighbours = time_neighbours(store)
+    tasks = [(session, order[a:a + framesPerTask], {k: neighbours[k] for k in order[a:a + framesPerTask]})
+             for a in range(0, len(order), framesPerTask)]
+    rows = []
+    with Pool(nworkers) as pool:
+        for out in pool.imap_unordered(_clean_task, tasks):
+            for k, removed, n in out:
+                store.edit(k, np.unpackbits(removed, axis=-1, count=store.size[1]).astype(bool), 'clean_clouds.py')
+                rows.append([k, store.frames[k][0]] + [int(v) for v in n])
+    rows.sort()
+    rows = np.array(rows, dtype=np.int64).reshape(-1, 8)
+    frac = rows[:, 7] / np.maximum(rows[:, 2], 1)           # Kept fraction of the valid points
+    mad = np.median(np.abs(frac - np.median(frac))) if len(frac) else 0
+    flagged = np.abs(frac - np.median(frac)) > flagMAD * max(mad, 1e-3) if len(frac) else frac.astype(bool)
+    fname = os.path.join(store.dir, 'clean_stats.csv')
+    with open(fname, 'w') as f:
+        f.write(stats_header + '\n')
+        for r, fr, fl in zip(rows, frac, flagged):
+            f.write(','.join(str(v) for v in r) + f",{fr:.4f},{int(fl)}\n")
+    return rows, flagged
+
+if __name__ == '__main__':
+    rows, flagged = clean_session(sys.argv[1])
+    print(f"{sys.argv[1]}: cleaned {len(rows)} frames, {flagged.sum()} flagged for review")
+    [print(f"    frame {r[0]} (image {r[1]})") for r, fl in zip(rows, flagged) if fl]
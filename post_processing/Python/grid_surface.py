@@ -0,0 +1,166 @@
+# Last updated: 2026-10-17
+##################################
+# Surface elevation time series eta(x, y, t) for a whole session, gridded from the point clouds in <session>/recon
+# (recon_store.py, latest edit of each frame, e.g. after clean_clouds.py). Every frame's points are binned onto a fixed
+# XY grid (dX, dY as in E_Analyze.m) with vectorized reductions: mean, median, min, max and count of the elevation in
+# each cell. Cells with fewer than minCellPoints points are NaN.
+# <session>/recon/grid/ holds:
+#   meta.npz            grid edges, axes and statistics (a run with different inputs is refused)
+#   frames.csv          one row per gridded frame: store frame k, image number, time and the edit version gridded
+#   eta_NNNNN.npz       chunk of chunk_frames frames (t x y x x), one float32 array per statistic (count: uint32),
+#                       compressed; SurfaceGrid.read loads only the chunks a slice needs
+# Chunks are computed in a process pool, one chunk per task. Reruns are incremental: only chunks with new frames, or
+# frames whose latest edit version changed since they were gridded, are recomputed.
+# Usage:
+#   python grid_surface.py <session_dir>
+##################################
+import os
+import sys
+import numpy as np
+from multiprocessing import Pool
+from recon_store import ReconStore
+
+## Inputs
+dX = 0.1                            # grid step in x (meters)
+dY = 0.1                            # grid step in y (meters)
+xlim = [-10, 10]                    # grid extent in x (meters)
+ylim = [0, 20]                      # grid extent in y (meters)
+gridAxes = (0, 2)                   # point columns used as grid x and y: camera x (right) and z (range)
+etaAxis = 1                         # point column used as elevation ...
+etaSign = -1                        # ... with this sign (camera y points down; E_Analyze.m flips it too)
+stats = ('mean', 'median', 'min', 'max', 'count')
+minCellPoints = 1                   # cells with fewer points are NaN
+chunk_frames = 16
+nworkers = os.cpu_count()
+
+frames_header = 'k,image_num,t,version'
+
+def grid_edges():
+    x = np.arange(xlim[0], xlim[1] + dX / 2, dX)
+    y = np.arange(ylim[0], ylim[1] + dY / 2, dY)
+    return x, y
+
+# Function to reduce values per cell: dict of (ny, nx) arrays for each statistic
+def bin_points(pts, xedges, yedges):
+    nx, ny = len(xedges) - 1, len(yedges) - 1
+    ok = np.isfinite(pts).all(axis=1)
+    gx, gy, eta = pts[ok, gridAxes[0]], pts[ok, gridAxes[1]], etaSign * pts[ok, etaAxis]
+    ix = np.floor((gx - xedges[0]) / dX).astype(np.int64)
+    iy = np.floor((gy - yedges[0]) / dY).astype(np.int64)
+    inside = (ix >= 0) & (ix < nx) & (iy >= 0) & (iy < ny)
+    cell, eta = iy[inside] * nx + ix[inside], eta[inside]
+    count = np.bincount(cell, minlength=nx * ny)
+    out = {'count': count}
+    empty = count < max(minCellPoints, 1)
+    if 'mean' in stats:
+        mean = np.bincount(cell, weights=eta, minlength=nx * ny) / np.maximum(count, 1)
+        out['mean'] = np.where(empty, np.nan, mean)
+    if {'median', 'min', 'max'} & set(stats):
+        order = np.lexsort((eta, cell))                 # By cell, then elevation
+        v = eta[order]
+        cells = np.flatnonzero(count)
+        n = count[cells]
+        start = np.cumsum(n) - n                        # First value of each cell in v
+        reduced = {'min': v[start], 'max': v[start + n - 1], 'median': (v[start + (n - 1) // 2] + v[start + n // 2]) / 2}
+        for stat in ('median', 'min', 'max'):
+            if stat in stats:
+                full = np.full(nx * ny, np.nan)
+                full[cells] = reduced[stat]
+                out[stat] = np.where(empty, np.nan, full)
+    return {stat: out[stat].reshape(ny, nx).astype(np.uint32 if stat == 'count' else np.float32) for stat in stats}
+
+def _grid_task(args):
+    session, c, ks = args
+    store = ReconStore(session)
+    xedges, yedges = grid_edges()
+    cube = {stat: [] for stat in stats}
+    rows = []
+    for k in ks:
+        pts, _ = store.points(k)
+        [cube[stat].append(g) for stat, g in bin_points(pts, xedges, yedges).items()]
+        rows.append((k, store.frames[k][0], store.frames[k][1], (store.versions(k) or [0])[-1]))
+    fname = os.path.join(session, 'recon', 'grid', f"eta_{c:05}.npz")
+    with open(fname + '.tmp', 'wb') as f:
+        np.savez_compressed(f, **{stat: np.stack(v) for stat, v in cube.items()})
+    os.replace(fname + '.tmp', fname)
+    return rows
+
+def write_frames(fdir, rows):
+    with open(os.path.join(fdir, 'frames.csv.tmp'), 'w') as f:
+        f.write(frames_header + '\n')
+        f.writelines(f"{k},{n},{t:.6f},{v}\n" for k, n, t, v in rows)
+    os.replace(os.path.join(fdir, 'frames.csv.tmp'), os.path.join(fdir, 'frames.csv'))
+
+def read_frames(fdir):
+    rows = []
+    fname = os.path.join(fdir, 'frames.csv')
+    if os.path.exists(fname):
+        with open(fname) as f:
+            f.readline()
+            for line in f:
+                k, n, t, v = line.strip().split(',')
+                rows.append((int(k), int(n), float(t), int(v)))
+    return rows
+
+# Function to grid a session's new and edited frames. Returns the SurfaceGrid.
+def grid_session(session):
+    store = ReconStore(session)
+    fdir = os.path.join(store.dir, 'grid')
+    os.makedirs(fdir, exist_ok=True)
+    xedges, yedges = grid_edges()
+    meta = {'xedges': xedges, 'yedges': yedges, 'gridAxes': gridAxes, 'etaAxis': etaAxis, 'etaSign': etaSign,
+            'stats': stats, 'minCellPoints': minCellPoints, 'chunk_frames': chunk_frames}
+    fname_meta = os.path.join(fdir, 'meta.npz')
+    if os.path.exists(fname_meta):
+        with np.load(fname_meta) as old:
+            if set(old.files) != set(meta) or not all(np.array_equal(old[key], np.asarray(v)) for key, v in meta.items()):
+                raise ValueError(f"{fdir} was gridded with different inputs; remove it to regrid")
+    else:
+        np.savez(fname_meta, **meta)
+    rows = read_frames(fdir)[:len(store)]
+    version = [(store.versions(k) or [0])[-1] for k in range(len(store))]
+    stale = {k // chunk_frames for k in range(len(store)) if k >= len(rows) or rows[k][3] != version[k]}
+    tasks = [(session, c, list(range(c * chunk_frames, min((c + 1) * chunk_frames, len(store))))) for c in sorted(stale)]
+    done = {r[0]: r for r in rows}
+    if tasks:
+        with Pool(min(nworkers, len(tasks))) as pool:
+            for out in pool.imap_unordered(_grid_task, tasks):
+                done.update((r[0], r) for r in out)
+                # Rows are by position, so only the gridded prefix is recorded; an interrupted run redoes the rest
+                n = next((k for k in range(len(store)) if k not in done), len(store))
+                write_frames(fdir, [done[k] for k in range(n)])
+    return SurfaceGrid(session)
+
+class SurfaceGrid:
+    # Reader for <session>/recon/grid
+    def __init__(self, session):
+        self.dir = os.path.join(session, 'recon', 'grid')
+        with np.load(os.path.join(self.dir, 'meta.npz')) as meta:
+            self.xedges, self.yedges = meta['xedges'], meta['yedges']
+            self.stats, self.chunk_frames = tuple(meta['stats']), int(meta['chunk_frames'])
+        self.x = (self.xedges[:-1] + self.xedges[1:]) / 2      # Cell centres
+        self.y = (self.yedges[:-1] + self.yedges[1:]) / 2
+        rows = read_frames(self.dir)
+        self.image_num = np.array([r[1] for r in rows], dtype=np.int64)
+        self.t = np.array([r[2] for r in rows])
+
+    @property
+    def shape(self):
+        return (len(self.t), len(self.y), len(self.x))
+
+    def read(self, stat='mean', t=slice(None), y=slice(None), x=slice(None)):
+        # eta[t, y, x] for a statistic, with t, y and x slices (or index arrays) of the (t x y x x) array
+        ks = np.arange(len(self.t))[t]
+        kk = np.atleast_1d(ks)
+        out = [np.zeros((0, len(self.y), len(self.x)), np.uint32 if stat == 'count' else np.float32)[:, y, x]]
+        for c in np.unique(kk // self.chunk_frames):
+            with np.load(os.path.join(self.dir, f"eta_{c:05}.npz")) as z:
+                out.append(z[stat][kk[kk // self.chunk_frames == c] % self.chunk_frames][:, y, x])
+        cube = np.concatenate(out)
+        return cube[0] if np.ndim(ks) == 0 else cube
+
+if __name__ == '__main__':
+    grid = grid_session(sys.argv[1])
+    eta = grid.read('mean', t=slice(-1, None))
+    print(f"{sys.argv[1]}: eta grid {grid.shape} (t x y x x), dX {dX} m, dY {dY} m; "
+          f"last frame {np.isfinite(eta).mean() * 100:.1f}% of cells filled")
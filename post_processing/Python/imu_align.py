@@ -0,0 +1,128 @@
+# Last updated: 2026-10-17
+##################################
+# Join a session's IMU log to its frames: for every cam0/cam1 image, interpolate the VN-200 attitude (quaternion slerp,
+# so yaw wrapping through +/-180 is handled) and GPS position at the frame's host timestamp.
+# Reads IMU_<session>.txt (imu.py CSV) or IMU_<session>.bin (imulog.py records) and writes poses_<session>.csv.
+# Usage:
+#   python imu_align.py <session_dir>
+##################################
+import os
+import sys
+import glob
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'run_cam'))
+from imulog import imu_dtype
+
+pose_dtype = np.dtype([('cam', 'u1'), ('image_num', '<u4'), ('t', '<f8'), ('yaw', '<f8'), ('pitch', '<f8'),
+                       ('roll', '<f8'), ('lat', '<f8'), ('lon', '<f8'), ('alt', '<f8'), ('imu_gap', '<f8')])
+pose_header = 'cam,image_num,t (s of UTC day),yaw (deg),pitch (deg),roll (deg),lat (deg),lon (deg),alt (m),imu_gap (s)'
+
+# Function to convert HHMMSS[fff...] stamps (array of digit strings) to seconds of day
+def stamp_to_seconds(stamps):
+    stamps = np.char.strip(np.asarray(stamps).astype('U'))
+    scale = 10 ** (np.char.str_len(stamps).astype(np.int64) - 6)   # HHMMSSsss (imu.py header) or HHMMSSffffff
+    v = stamps.astype(np.int64)
+    hms = v // scale
+    return (hms // 10000) * 3600 + (hms // 100 % 100) * 60 + hms % 100 + (v % scale) / scale
+
+# Function to undo midnight UTC rollover in a time-of-day series (in acquisition order)
+def unwrap_days(t):
+    days = np.concatenate([[0], np.cumsum(np.diff(t) < -43200)])
+    return t + 86400 * days
+
+# Function to load the IMU log into arrays: t (s of day, unwrapped), ypr (deg), lla
+def load_imu(fname_imu):
+    if fname_imu.endswith('.bin'):
+        rec = np.fromfile(fname_imu, dtype=imu_dtype)
+        us = rec['host_us']
+        t = (us // 1000000) % 86400 + (us % 1000000) / 1e6
+        return unwrap_days(t.astype(np.float64)), rec['ypr'].astype(np.float64), rec['lla'].copy()
+    with open(fname_imu, 'r') as f:
+        f.readline()                                        # imu_headerLine
+        text = f.read().translate(str.maketrans('\n', ',', '()'))   # One flat comma-separated token stream
+    tok = np.array(text.split(','), dtype=object)
+    ncol = 17
+    rows = len(tok) // ncol
+    tok = tok[:rows * ncol].reshape(rows, ncol)             # Any partial last line (power cut) is dropped
+    t = stamp_to_seconds(tok[:, 0])
+    ypr = np.char.strip(tok[:, 2:5].astype('U')).astype(np.float64)
+    lla = np.char.strip(tok[:, 14:17].astype('U')).astype(np.float64)
+    return unwrap_days(t), ypr, lla
+
+# Function to list a session's frames: cam, image number and host time (s of day)
+def load_frames(session):
+    names = sorted(os.path.basename(f) for cam in ('cam0', 'cam1') for f in glob.glob(os.path.join(session, cam, '*.jpg')))
+    parts = np.array([n[:-4].split('_') for n in names], dtype='U16').reshape(-1, 3)
+    return parts[:, 0].astype(np.uint8), parts[:, 2].astype(np.uint32), stamp_to_seconds(parts[:, 1])
+
+# Function to convert yaw/pitch/roll (deg, ZYX as reported by the VN-200) to quaternions (w, x, y, z)
+def ypr_to_quat(ypr):
+    y, p, r = np.deg2rad(ypr).T / 2
+    cy, sy, cp, sp, cr, sr = np.cos(y), np.sin(y), np.cos(p), np.sin(p), np.cos(r), np.sin(r)
+    return np.stack([cr * cp * cy + sr * sp * sy,
+                     sr * cp * cy - cr * sp * sy,
+                     cr * sp * cy + sr * cp * sy,
+                     cr * cp * sy - sr * sp * cy], axis=1)
+
+def quat_to_ypr(q):
+    w, x, y, z = q.T
+    yaw = np.arctan2(2 * (w * z + x * y), 1 - 2 * (y * y + z * z))
+    pitch = np.arcsin(np.clip(2 * (w * y - z * x), -1, 1))
+    roll = np.arctan2(2 * (w * x + y * z), 1 - 2 * (x * x + y * y))
+    return np.rad2deg(np.stack([yaw, pitch, roll], axis=1))
+
+# Function to slerp between quaternion rows q0 and q1 with weights u
+def slerp(q0, q1, u):
+    dot = np.sum(q0 * q1, axis=1)
+    q1 = np.where(dot[:, None] < 0, -q1, q1)                # Shortest path
+    dot = np.abs(dot)
+    theta = np.arccos(np.clip(dot, -1, 1))
+    s = np.sin(theta)
+    small = s < 1e-6
+    s = np.where(small, 1, s)
+    w0 = np.where(small, 1 - u, np.sin((1 - u) * theta) / s)
+    w1 = np.where(small, u, np.sin(u * theta) / s)
+    q = w0[:, None] * q0 + w1[:, None] * q1
+    return q / np.linalg.norm(q, axis=1, keepdims=True)
+
+# Function to interpolate attitude and position at times tq
+def interpolate_pose(t_imu, ypr, lla, tq):
+    order = np.argsort(t_imu, kind='stable')
+    t_imu, ypr, lla = t_imu[order], ypr[order], lla[order]
+    j = np.clip(np.searchsorted(t_imu, tq), 1, len(t_imu) - 1)
+    t0, t1 = t_imu[j - 1], t_imu[j]
+    u = np.clip((tq - t0) / np.where(t1 > t0, t1 - t0, 1), 0, 1)
+    q = ypr_to_quat(ypr)
+    att = quat_to_ypr(slerp(q[j - 1], q[j], u))
+    pos = np.stack([np.interp(tq, t_imu, lla[:, k]) for k in range(3)], axis=1)
+    gap = np.minimum(np.abs(tq - t0), np.abs(t1 - tq))
+    return att, pos, gap
+
+# Function to build the per-frame pose table for a session
+def align_session(session):
+    name = os.path.basename(os.path.normpath(session))
+    fname_imu = os.path.join(session, f"IMU_{name}.bin")
+    if not os.path.exists(fname_imu):
+        fname_imu = os.path.join(session, f"IMU_{name}.txt")
+    t_imu, ypr, lla = load_imu(fname_imu)
+    cam, num, t = load_frames(session)
+    t = t + 86400 * ((t - t_imu[0]) < -43200)               # Frames after a midnight the IMU log started before
+    att, pos, gap = interpolate_pose(t_imu, ypr, lla, t)
+    poses = np.zeros(len(t), dtype=pose_dtype)
+    poses['cam'], poses['image_num'], poses['t'] = cam, num, t
+    poses['yaw'], poses['pitch'], poses['roll'] = att.T
+    poses['lat'], poses['lon'], poses['alt'] = pos.T
+    poses['imu_gap'] = gap
+    return poses[np.lexsort((poses['cam'], poses['t']))]
+
+def save_poses(poses, fname):
+    np.savetxt(fname, poses.tolist(), delimiter=',', header=pose_header, comments='',
+               fmt=['%d', '%d', '%.6f', '%.4f', '%.4f', '%.4f', '%.8f', '%.8f', '%.3f', '%.6f'])
+
+if __name__ == '__main__':
+    session = sys.argv[1]
+    poses = align_session(session)
+    fname = os.path.join(session, f"poses_{os.path.basename(os.path.normpath(session))}.csv")
+    save_poses(poses, fname)
+    print(f"{fname}: {len(poses)} frames")
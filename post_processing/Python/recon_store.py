@@ -0,0 +1,225 @@
+# Last updated: 2026-10-17
+##################################
+# Compact session-level reconstruction store (replaces the per-frame .mat files written by B_Rectify.m).
+# <session>/recon/ holds:
+#   meta.npz            Q (OpenCV convention), DisparityRange, image size, rectification map file
+#   frames.csv          one row per frame: image number, time, source cam0/cam1 files, chunk and slot (appended as chunks are written)
+#   disp_NNNNN.npz      chunk of chunk_frames disparity maps, int16 fixed point (x16, OpenCV), invalid pixels zeroed,
+#                       plus the bit-packed validity masks; compressed
+#   edits/<k>_vN.npz    versioned edits to frame k: bit-packed mask of pixels removed by that edit
+# Points are reconstructed on read from disparity and Q; edits never copy the points.
+# A store opened with mode='r' (the default) never writes the chunks or frames.csv, so any number of processes can read
+# it at once; only the single writer (mode='a') appends frames. Files are written through unique temporary names.
+# Usage:
+#   python recon_store.py import <session_dir> [rectmaps.npz]     (pack <session>/disparity/*.png from batch_rectify.py)
+#   python recon_store.py ply <session_dir> <k> <out.ply>
+#   python recon_store.py mat <session_dir> <k> <out.mat>
+##################################
+import os
+import sys
+import glob
+import time
+import tempfile
+import numpy as np
+
+chunk_frames = 16
+frames_header = 'k,image_num,t,name0,name1,chunk,slot'
+
+# Function to write a file atomically: write(f) to a unique temporary file in the same directory, then rename it
+def write_atomic(fname, write):
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(fname), prefix=os.path.basename(fname) + '.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            write(f)
+        os.replace(tmp, fname)
+    except BaseException:
+        os.remove(tmp)
+        raise
+
+class ReconStore:
+    def __init__(self, session, Q=None, size=None, disparity_range=(0, 64), fname_maps='', mode='r'):
+        self.session = session
+        self.dir = os.path.join(session, 'recon')
+        self.mode = mode                            # 'r': read frames (edits can still be added); 'a': also append frames
+        fname_meta = os.path.join(self.dir, 'meta.npz')
+        if os.path.exists(fname_meta):
+            with np.load(fname_meta) as meta:
+                self.Q, self.size = meta['Q'], tuple(meta['size'])
+                self.disparity_range, self.fname_maps = tuple(meta['disparity_range']), str(meta['fname_maps'])
+        elif mode == 'a' and Q is not None:
+            os.makedirs(self.dir, exist_ok=True)
+            self.Q, self.size = np.asarray(Q, dtype=np.float64), tuple(size)           # size = (h, w)
+            self.disparity_range, self.fname_maps = tuple(disparity_range), fname_maps
+            write_atomic(fname_meta, lambda f: np.savez(f, Q=self.Q, size=self.size, disparity_range=self.disparity_range,
+                                                        fname_maps=fname_maps))
+        else:
+            raise FileNotFoundError(f"{fname_meta} not found (a new store needs mode='a' and Q)")
+        self.frames = []                            # [image_num, t, name0, name1, chunk, slot]
+        fname_frames = os.path.join(self.dir, 'frames.csv')
+        if os.path.exists(fname_frames):
+            with open(fname_frames, 'rb') as f:
+                text = f.read()
+            if mode == 'a' and not text.endswith(b'\n'):
+                with open(fname_frames, 'rb+') as f:
+                    f.truncate(text.rfind(b'\n') + 1)  # Drop a row cut short by a crash
+            for line in text[:text.rfind(b'\n') + 1].decode().splitlines()[1:]:   # Readers ignore a row being written
+                k, num, t, n0, n1, c, s = line.split(',')
+                self.frames.append([int(num), float(t), n0, n1, int(c), int(s)])
+        self._rows = len(self.frames)               # Frames whose row is in frames.csv
+        self.names = {row[3]: k for k, row in enumerate(self.frames)}
+        self._pending = []                          # Frames of the last, partly filled chunk
+        self._cache = (None, None, None)            # Last chunk read: (chunk, disp, valid)
+        last = len(self.frames) % chunk_frames
+        if last and mode == 'a':                    # Appends go on filling the last chunk
+            disp, valid = self._load_chunk(len(self.frames) // chunk_frames)
+            self._pending = [(disp[s], valid[s]) for s in range(last)]
+
+    def __len__(self):
+        return len(self.frames)
+
+    def __contains__(self, name1):
+        return name1 in self.names
+
+    def append(self, image_num, t, name0, name1, disp16):
+        # Add one frame (OpenCV int16 disparity x16). Written in whole compressed chunks.
+        if self.mode != 'a':
+            raise PermissionError(f"{self.dir} is open read-only")
+        valid = (disp16 >= self.disparity_range[0] * 16) & (disp16 > 0)      # Zero disparity has no finite point
+        k = len(self.frames)
+        self.frames.append([image_num, t, name0, name1, k // chunk_frames, k % chunk_frames])
+        self.names[name1] = k
+        self._pending.append((np.where(valid, disp16, 0).astype(np.int16), valid))
+        if len(self._pending) == chunk_frames:
+            self.flush()
+            self._pending = []
+        return k
+
+    def flush(self):
+        if not self._pending:
+            return
+        c = (len(self.frames) - 1) // chunk_frames
+        fname = os.path.join(self.dir, f"disp_{c:05}.npz")
+        write_atomic(fname, lambda f: np.savez_compressed(f, disp=np.stack([d for d, v in self._pending]),
+                                                          valid=np.packbits(np.stack([v for d, v in self._pending]), axis=-1)))
+        # Append only the new rows (after the chunk is on disk); a frame's row never changes once written
+        fname_frames = os.path.join(self.dir, 'frames.csv')
+        with open(fname_frames, 'a') as f:
+            if f.tell() == 0:
+                f.write(frames_header + '\n')
+            f.write(''.join(f"{k},{n},{t:.6f},{n0},{n1},{c},{s}\n" for k, (n, t, n0, n1, c, s)
+                            in enumerate(self.frames[self._rows:], self._rows)))
+        self._rows = len(self.frames)
+        self._cache = (None, None, None)
+
+    def close(self):
+        self.flush()
+
+    def _load_chunk(self, c):
+        if self._pending and c == (len(self.frames) - 1) // chunk_frames:
+            self.flush()                            # Reading a frame that is still only in memory
+        if self._cache[0] != c:
+            with np.load(os.path.join(self.dir, f"disp_{c:05}.npz")) as z:
+                valid = np.unpackbits(z['valid'], axis=-1, count=self.size[1]).astype(bool)
+                self._cache = (c, z['disp'], valid)
+        return self._cache[1], self._cache[2]
+
+    def disparity(self, k):
+        # Disparity in pixels (float32), NaN where invalid
+        disp, valid = self._load_chunk(self.frames[k][4])
+        d = disp[self.frames[k][5]].astype(np.float32) / 16
+        d[~valid[self.frames[k][5]]] = np.nan
+        return d
+
+    def versions(self, k):
+        return sorted(int(f.rsplit('_v', 1)[1][:-4]) for f in glob.glob(os.path.join(self.dir, 'edits', f"{k}_v*.npz")))
+
+    def edit(self, k, removed, note=''):
+        # Record a new version of frame k that removes the pixels in `removed` (h x w bool). Returns the version.
+        v = (self.versions(k) or [0])[-1] + 1
+        os.makedirs(os.path.join(self.dir, 'edits'), exist_ok=True)
+        write_atomic(os.path.join(self.dir, 'edits', f"{k}_v{v}.npz"),
+                     lambda f: np.savez_compressed(f, removed=np.packbits(removed, axis=-1), note=note,
+                                                   time=time.strftime('%Y%m%d_%H%M%S')))
+        return v
+
+    def mask(self, k, version=None):
+        # Pixels kept in frame k after edits up to `version` (None = latest, 0 = original)
+        disp, valid = self._load_chunk(self.frames[k][4])
+        keep = valid[self.frames[k][5]].copy()
+        for v in self.versions(k):
+            if version is not None and v > version:
+                break
+            with np.load(os.path.join(self.dir, 'edits', f"{k}_v{v}.npz")) as z:
+                keep &= ~np.unpackbits(z['removed'], axis=-1, count=self.size[1]).astype(bool)
+        return keep
+
+    def points(self, k, version=None):
+        # Nx3 points in meters for the kept pixels, plus their (row, col) pixel indices
+        keep = self.mask(k, version)
+        rows, cols = np.nonzero(keep)
+        d = self.disparity(k)[rows, cols]
+        hom = np.stack([cols, rows, d, np.ones_like(d)]).astype(np.float64).T @ self.Q.T
+        return (hom[:, :3] / hom[:, 3:]) / 1000, (rows, cols)       # Calibration is in mm
+
+    def colors(self, k, pix):
+        # RGB of the rectified left (cam1) frame at pixel indices pix (needs the rectification maps)
+        import cv2
+        maps = np.load(self.fname_maps)
+        left = cv2.imread(os.path.join(self.session, 'cam1', self.frames[k][3]))
+        J1 = cv2.remap(left, maps['m1x'], maps['m1y'], cv2.INTER_LINEAR)
+        return J1[pix][:, ::-1]
+
+    def export_ply(self, k, fname, version=None):
+        pts, pix = self.points(k, version)
+        rgb = self.colors(k, pix) if self.fname_maps else np.full((len(pts), 3), 255, np.uint8)
+        rec = np.zeros(len(pts), dtype=[('x', '<f4'), ('y', '<f4'), ('z', '<f4'), ('r', 'u1'), ('g', 'u1'), ('b', 'u1')])
+        rec['x'], rec['y'], rec['z'] = pts.T
+        rec['r'], rec['g'], rec['b'] = rgb.T
+        with open(fname, 'wb') as f:
+            f.write((f"ply\nformat binary_little_endian 1.0\nelement vertex {len(rec)}\n"
+                     "property float x\nproperty float y\nproperty float z\n"
+                     "property uchar red\nproperty uchar green\nproperty uchar blue\nend_header\n").encode())
+            f.write(rec.tobytes())
+
+    def export_mat(self, k, fname, version=None):
+        # Variables named as in B_Rectify.m (reprojectionMatrix in MATLAB's transposed convention)
+        from scipy.io import savemat
+        pts, pix = self.points(k, version)
+        out = {'points3D': pts, 'disparityMap': self.disparity(k), 'reprojectionMatrix': self.Q.T,
+               'imageNum': self.frames[k][0], 'cam0File': self.frames[k][2], 'cam1File': self.frames[k][3]}
+        if self.fname_maps:
+            out['colors'] = self.colors(k, pix)
+        savemat(fname, out, do_compression=True)
+
+# Function to pack <session>/disparity/*.png (batch_rectify.py output) into the store
+def import_pngs(session, fname_maps=''):
+    import cv2
+    from batch_rectify import DisparityRange
+    from session_index import SessionIndex
+    Q = np.loadtxt(os.path.join(session, 'disparity', 'Q.txt'))
+    index = SessionIndex(session)
+    index.refresh()
+    store = None
+    for image_num, t, name0, name1 in index.pairs():
+        fname = os.path.join(session, 'disparity', f"{name1.split('_')[1][:6]}_{image_num:05}.png")
+        if not os.path.exists(fname) or (store and name1 in store):
+            continue
+        png = cv2.imread(fname, cv2.IMREAD_UNCHANGED)
+        if store is None:
+            store = ReconStore(session, Q, png.shape, DisparityRange, fname_maps, mode='a')
+            if name1 in store:
+                continue
+        disp16 = png.astype(np.int32) + (DisparityRange[0] - 1) * 16      # Undo batch_rectify.disparity_to_png
+        store.append(image_num, t, name0, name1, disp16.astype(np.int16))
+    if store:
+        store.close()
+    return store
+
+if __name__ == '__main__':
+    if sys.argv[1] == 'import':
+        store = import_pngs(sys.argv[2], sys.argv[3] if len(sys.argv) > 3 else '')
+        print(f"{sys.argv[2]}: {len(store) if store else 0} frames in store")
+    elif sys.argv[1] == 'ply':
+        ReconStore(sys.argv[2]).export_ply(int(sys.argv[3]), sys.argv[4])
+    elif sys.argv[1] == 'mat':
+        ReconStore(sys.argv[2]).export_mat(int(sys.argv[3]), sys.argv[4])
@@ -0,0 +1,132 @@
+# Last updated: 2026-10-17
+##################################
+# Persistent stereo-pair index for a session. cam0/ and cam1/ are scanned once into an SQLite file
+# (<session>/index.sqlite); later refreshes only add frames that are new on disk. A cam0 and cam1 frame are a pair when
+# they have the same image number and host timestamps within pair_tol seconds (image numbers restart every burst).
+# Pair, orphan and time-range queries go through B-tree indexes.
+# Usage:
+#   python session_index.py <session_dir>      (refresh the index and write pairs.csv for MATLAB)
+##################################
+import os
+import sys
+import sqlite3
+import numpy as np
+from imu_align import stamp_to_seconds
+
+pair_tol = 0.25                             # Max cam0/cam1 timestamp difference for a pair (s)
+
+schema = """
+CREATE TABLE IF NOT EXISTS frames (name TEXT PRIMARY KEY, cam INTEGER, image_num INTEGER, t REAL, paired INTEGER DEFAULT 0);
+CREATE INDEX IF NOT EXISTS frames_unpaired ON frames (cam) WHERE paired = 0;
+CREATE TABLE IF NOT EXISTS pairs (image_num INTEGER, t REAL, name0 TEXT UNIQUE, name1 TEXT UNIQUE);
+CREATE INDEX IF NOT EXISTS pairs_num ON pairs (image_num, t);
+CREATE INDEX IF NOT EXISTS pairs_t ON pairs (t);
+"""
+
+# Function to get the session start (s of day) from a HHMMSS_<mode> session folder name, or None
+def session_start(session):
+    name = os.path.basename(os.path.normpath(session))
+    return float(stamp_to_seconds([name[:6]])[0]) if name[:6].isdigit() else None
+
+# Function to pair cam0 and cam1 frames: same image number, nearest timestamp within pair_tol. Returns row indices.
+def match_pairs(cam, num, t):
+    key = num * 200000.0 + t                                # Orders by image number, then time (t < 2 days)
+    c0, c1 = np.flatnonzero(cam == 0), np.flatnonzero(cam == 1)
+    c1 = c1[np.argsort(key[c1], kind='stable')]
+    if len(c0) == 0 or len(c1) == 0:
+        return c0[:0], c1[:0]
+    j = np.searchsorted(key[c1], key[c0])
+    lo, hi = c1[np.clip(j - 1, 0, len(c1) - 1)], c1[np.clip(j, 0, len(c1) - 1)]
+    best = np.where(np.abs(key[lo] - key[c0]) < np.abs(key[hi] - key[c0]), lo, hi)
+    ok = (num[best] == num[c0]) & (np.abs(t[best] - t[c0]) <= pair_tol)
+    i0, i1 = c0[ok], best[ok]
+    _, first = np.unique(i1, return_index=True)            # A cam1 frame pairs at most once
+    return i0[first], i1[first]
+
+class SessionIndex:
+    def __init__(self, session, fname=None):
+        self.session = session
+        self.db = sqlite3.connect(fname or os.path.join(session, 'index.sqlite'))
+        self.db.execute("PRAGMA synchronous = OFF")           # The index can always be rebuilt from cam0/cam1
+        self.db.executescript(schema)
+        self.t_start = session_start(session)
+
+    def refresh(self):
+        # Add frames that are not in the index yet and pair them. Returns (new frames, new pairs).
+        known = set(r[0] for r in self.db.execute("SELECT name FROM frames"))
+        names = [e.name for cam in ('cam0', 'cam1') if os.path.isdir(os.path.join(self.session, cam))
+                 for e in os.scandir(os.path.join(self.session, cam)) if e.name.endswith('.jpg') and e.name not in known]
+        if not names:
+            return 0, 0
+        names.sort()                                        # Sorted inserts keep the B-trees append-only
+        parts = np.array([n[:-4].split('_') for n in names], dtype='U16')
+        t = stamp_to_seconds(parts[:, 1])
+        if self.t_start is not None:
+            t = t + 86400 * ((t - self.t_start) < -43200)     # Frames taken after midnight UTC
+        cam, num = parts[:, 0].astype(int), parts[:, 2].astype(int)
+        old = self.db.execute("SELECT name, cam, image_num, t FROM frames WHERE paired = 0").fetchall()
+        if old:                                             # Unpaired frames can pair with the new ones
+            oname, ocam, onum, ot = zip(*old)
+            allnames = np.concatenate([np.array(names, dtype=object), np.array(oname, dtype=object)])
+            cam, num, t = np.concatenate([cam, ocam]), np.concatenate([num, onum]), np.concatenate([t, ot])
+        else:
+            allnames = np.array(names, dtype=object)
+        i0, i1 = match_pairs(cam, num, t)
+        i1 = i1[np.argsort(i0)]
+        i0 = np.sort(i0)
+        paired = np.zeros(len(allnames), dtype=int)
+        paired[i0], paired[i1] = 1, 1
+        nnew = len(names)
+        with self.db:
+            self.db.executemany("INSERT INTO frames VALUES (?, ?, ?, ?, ?)",
+                                zip(names, cam[:nnew].tolist(), num[:nnew].tolist(), t[:nnew].tolist(), paired[:nnew].tolist()))
+            if old:
+                self.db.executemany("UPDATE frames SET paired = 1 WHERE name = ?", ((n,) for n in allnames[nnew:][paired[nnew:] == 1]))
+            self.db.executemany("INSERT INTO pairs VALUES (?, ?, ?, ?)",
+                                zip(num[i0].tolist(), np.minimum(t[i0], t[i1]).tolist(), allnames[i0], allnames[i1]))
+        return nnew, len(i0)
+
+    def count_pairs(self):
+        return self.db.execute("SELECT COUNT(*) FROM pairs").fetchone()[0]
+
+    def pairs(self):
+        # All pairs in time order: (image_num, t, name0, name1)
+        return self.db.execute("SELECT image_num, t, name0, name1 FROM pairs ORDER BY t").fetchall()
+
+    def pair(self, image_num, t=None):
+        # Pair(s) with this image number; with t, only the one from the burst around t
+        if t is None:
+            return self.db.execute("SELECT image_num, t, name0, name1 FROM pairs WHERE image_num = ? ORDER BY t",
+                                   (image_num,)).fetchall()
+        return self.db.execute("SELECT image_num, t, name0, name1 FROM pairs WHERE image_num = ? AND t BETWEEN ? AND ?",
+                               (image_num, t - pair_tol, t + pair_tol)).fetchall()
+
+    def corresponding(self, name):
+        # The other camera's file for a frame name, or None (replaces find_corresponding_file.m)
+        r = self.db.execute("SELECT name1 FROM pairs WHERE name0 = ? UNION ALL SELECT name0 FROM pairs WHERE name1 = ?",
+                            (name, name)).fetchone()
+        return r[0] if r else None
+
+    def orphans(self):
+        # Frames with no partner in the other camera: (cam, image_num, t, name)
+        return self.db.execute("SELECT cam, image_num, t, name FROM frames WHERE paired = 0 ORDER BY t").fetchall()
+
+    def time_range(self, t0, t1):
+        # Pairs with t0 <= t <= t1 (s of UTC day, +86400 after midnight)
+        return self.db.execute("SELECT image_num, t, name0, name1 FROM pairs WHERE t BETWEEN ? AND ? ORDER BY t",
+                               (t0, t1)).fetchall()
+
+    def export_csv(self, fname):
+        with open(fname, 'w') as f:
+            f.write('image_num,t,name0,name1\n')
+            f.writelines(f"{n},{t:.6f},{a},{b}\n" for n, t, a, b in self.pairs())
+
+    def close(self):
+        self.db.close()
+
+if __name__ == '__main__':
+    index = SessionIndex(sys.argv[1])
+    nframes, npairs = index.refresh()
+    index.export_csv(os.path.join(sys.argv[1], 'pairs.csv'))
+    print(f"{nframes} new frames, {npairs} new pairs, {len(index.orphans())} orphans")
+    index.close()
@@ -0,0 +1,102 @@
+# Last updated: 2026-10-17
+##################################
+# Streaming stereo dataset: frame pairs (cam1 = left, cam0 = right, as in B_Rectify.m) come from session_index.py and
+# are decoded lazily by a thread pool. Frames stay uint8 until a batch is assembled, batches are normalized to float32,
+# and at most `prefetch` batches are held in memory. Decoded (and downsampled) frames can be cached on disk as .npy.
+# Usage:
+#   data = StereoDataset(session, batch_size=8, downsample=2)
+#   model.fit(data.as_tf_dataset(), epochs=10)      or      for left, right in data: ...
+##################################
+import os
+import queue
+import threading
+import cv2
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from session_index import SessionIndex
+
+reduced_flags = {1: cv2.IMREAD_GRAYSCALE, 2: cv2.IMREAD_REDUCED_GRAYSCALE_2,
+                 4: cv2.IMREAD_REDUCED_GRAYSCALE_4, 8: cv2.IMREAD_REDUCED_GRAYSCALE_8}
+
+class StereoDataset:
+    def __init__(self, session, batch_size=8, downsample=1, workers=4, prefetch=2, cache_dir=None, shuffle=False, index=None):
+        self.session = session
+        self.batch_size = batch_size
+        self.downsample = downsample        # 1, 2, 4 or 8 (decoded at reduced size by libjpeg)
+        self.workers = workers
+        self.prefetch = prefetch            # Batches decoded ahead of the consumer
+        self.cache_dir = cache_dir          # Optional dir for decoded .npy frames
+        self.shuffle = shuffle
+        if index is None:
+            index = SessionIndex(session, ':memory:')
+        index.refresh()
+        self.pairs = [(os.path.join(session, 'cam1', name1), os.path.join(session, 'cam0', name0))
+                      for image_num, t, name0, name1 in index.pairs()]
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+        self.shape = self.load(self.pairs[0][0]).shape if self.pairs else (0, 0)
+
+    def __len__(self):
+        return -(-len(self.pairs) // self.batch_size)
+
+    def load(self, path):
+        # One grayscale uint8 frame, from the cache if possible
+        if self.cache_dir:
+            fname = os.path.join(self.cache_dir, f"{os.path.basename(path)[:-4]}_{self.downsample}.npy")
+            if os.path.exists(fname):
+                return np.load(fname)
+        img = cv2.imread(path, reduced_flags[self.downsample])
+        if img is None:
+            raise IOError(f"Could not read {path}")
+        if self.cache_dir:
+            np.save(fname + '.tmp.npy', img)
+            os.replace(fname + '.tmp.npy', fname)
+        return img
+
+    def pair(self, k):
+        return self.load(self.pairs[k][0]), self.load(self.pairs[k][1])
+
+    def _batch(self, pool, ks):
+        # Decode into preallocated uint8 arrays, then normalize the whole batch once in float32
+        left = np.empty((len(ks),) + self.shape, dtype=np.uint8)
+        right = np.empty((len(ks),) + self.shape, dtype=np.uint8)
+        for j, (l, r) in enumerate(pool.map(self.pair, ks)):
+            left[j], right[j] = l, r
+        left, right = left[..., None].astype(np.float32), right[..., None].astype(np.float32)
+        left *= 1 / 255
+        right *= 1 / 255
+        return left, right
+
+    def __iter__(self):
+        order = np.random.permutation(len(self.pairs)) if self.shuffle else np.arange(len(self.pairs))
+        batches = queue.Queue(maxsize=self.prefetch)
+        stop = threading.Event()
+
+        def producer():
+            with ThreadPoolExecutor(self.workers) as pool:
+                for b in range(len(self)):
+                    if stop.is_set():
+                        break
+                    batches.put(self._batch(pool, order[b * self.batch_size:(b + 1) * self.batch_size]))
+            batches.put(None)
+
+        thread = threading.Thread(target=producer, daemon=True)
+        thread.start()
+        try:
+            while True:
+                batch = batches.get()
+                if batch is None:
+                    return
+                yield batch
+        finally:
+            stop.set()
+            while thread.is_alive():            # Unblock the producer if the consumer stopped early
+                try:
+                    batches.get_nowait()
+                except queue.Empty:
+                    thread.join(0.05)
+
+    def as_tf_dataset(self):
+        import tensorflow as tf
+        spec = tf.TensorSpec(shape=(None,) + self.shape + (1,), dtype=tf.float32)
+        return tf.data.Dataset.from_generator(lambda: iter(self), output_signature=(spec, spec))
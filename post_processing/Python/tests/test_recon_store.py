@@ -0,0 +1,64 @@
+import os
+import numpy as np
+import clean_clouds
+import grid_surface
+from recon_store import ReconStore, chunk_frames
+
+Q = np.array([[1, 0, 0, -32], [0, 1, 0, -32], [0, 0, 0, 100], [0, 0, 10, 0]], float)
+
+def make_session(session, nframes=2 * chunk_frames + 5):
+    rng = np.random.default_rng(0)
+    store = ReconStore(session, Q, (64, 64), (0, 64), mode='a')
+    for i in range(nframes):
+        store.append(i + 1, i * 0.1, f"0_{i:05}.jpg", f"1_{i:05}.jpg", (16 * (20 + rng.random((64, 64)))).astype(np.int16))
+    store.close()
+
+def snapshot(session):
+    fdir = os.path.join(session, 'recon')
+    return {name: open(os.path.join(fdir, name), 'rb').read() for name in os.listdir(fdir) if name.startswith(('disp_', 'frames'))}
+
+def test_reopen_appends(tmp_path):
+    session = str(tmp_path)
+    make_session(session, 20)
+    store = ReconStore(session, mode='a')
+    for i in range(20, 40):
+        store.append(i + 1, i * 0.1, f"0_{i:05}.jpg", f"1_{i:05}.jpg", np.full((64, 64), 32, np.int16))
+    store.close()
+    store = ReconStore(session)
+    assert [f[0] for f in store.frames] == list(range(1, 41))
+    assert store.disparity(37)[0, 0] == 2
+
+def test_read_only_has_no_side_effects(tmp_path):
+    session = str(tmp_path)
+    make_session(session)
+    with open(os.path.join(session, 'recon', 'frames.csv'), 'a') as f:
+        f.write('99,99,9.9,0_x')                   # Row still being written by the appender
+    before = snapshot(session)
+    store = ReconStore(session)
+    assert len(store) == 2 * chunk_frames + 5
+    assert np.isfinite(store.disparity(len(store) - 1)).any()
+    try:
+        store.append(0, 0, 'a', 'b', np.zeros((64, 64), np.int16))
+        assert False, 'append on a read-only store'
+    except PermissionError:
+        pass
+    store.close()
+    assert snapshot(session) == before
+
+def test_parallel_readers(tmp_path, monkeypatch):
+    session = str(tmp_path)
+    make_session(session)
+    before = snapshot(session)
+    monkeypatch.setattr(clean_clouds, 'nworkers', 2)
+    monkeypatch.setattr(clean_clouds, 'framesPerTask', 4)
+    monkeypatch.setattr(grid_surface, 'nworkers', 2)
+    monkeypatch.setattr(grid_surface, 'xlim', [-5, 5])
+    monkeypatch.setattr(grid_surface, 'ylim', [0, 10])
+    rows, flagged = clean_clouds.clean_session(session)
+    assert len(rows) == 2 * chunk_frames + 5
+    grid = grid_surface.grid_session(session)
+    assert grid.shape[0] == 2 * chunk_frames + 5
+    assert snapshot(session) == before
+    store = ReconStore(session)
+    [store.points(k) for k in range(len(store))]
+    assert not [name for name in os.listdir(store.dir) if name.endswith('.tmp')]
@@ -0,0 +1,42 @@
+import time
+import cv2
+import numpy as np
+import warm_disparity as wd
+from batch_rectify import create_matcher
+
+def textured_pair(rows=512, cols=1024):
+    rng = np.random.default_rng(0)
+    texture = cv2.GaussianBlur(rng.integers(0, 256, (rows, cols + 64)).astype(np.float32), (0, 0), 1.5)
+    d = 20 + 10 * np.linspace(0, 1, rows)[:, None] * np.ones((1, cols))      # Disparity 20-30 px, sloping with row
+    mx = (np.arange(cols)[None, :] - d + 64).astype(np.float32)
+    my = np.repeat(np.arange(rows, dtype=np.float32)[:, None], cols, axis=1)
+    J1 = cv2.remap(texture, mx, my, cv2.INTER_LINEAR)
+    J2 = texture[:, 64:]
+    return np.clip(J1, 0, 255).astype(np.uint8), np.clip(J2, 0, 255).astype(np.uint8)
+
+def best_time(fn, n=5):
+    t = []
+    for _ in range(n):
+        t0 = time.perf_counter()
+        out = fn()
+        t.append(time.perf_counter() - t0)
+    return min(t), out
+
+def test_warm_speedup_on_textured_scene(monkeypatch):
+    monkeypatch.setattr(wd, '_matcher', create_matcher())
+    cv2.setNumThreads(1)
+    J1, J2 = textured_pair()
+    t_full, full = best_time(lambda: wd.full_disparity(J1, J2))
+    t_warm, (warm, nfull, nskip) = best_time(lambda: wd.warm_disparity(J1, J2, full))
+    ntiles = -(-J1.shape[0] // wd.tile_size[0]) * -(-J1.shape[1] // wd.tile_size[1])
+    assert nfull + nskip <= ntiles // 4
+    mean_diff, bad1, valid_warm, valid_full = wd.accuracy(warm, full)
+    assert mean_diff < 0.25 and valid_warm >= 0.9 * valid_full
+    assert t_full / t_warm > 1.25
+
+def test_invalid_tiles_are_skipped(monkeypatch):
+    monkeypatch.setattr(wd, '_matcher', create_matcher())
+    J1, J2 = textured_pair(256, 512)
+    prev = np.full(J1.shape, wd.invalid16, np.int16)
+    warm, nfull, nskip = wd.warm_disparity(J1, J2, prev)
+    assert nfull == 0 and nskip == 4 and (warm == wd.invalid16).all()
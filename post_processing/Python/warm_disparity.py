@@ -0,0 +1,208 @@
+# Last updated: 2026-10-17
+##################################
+# Temporally warm-started disparity (incremental counterpart of batch_rectify.py for 12-25 Hz sequences).
+# Consecutive pairs are nearly identical, so each frame is matched in tiles whose SGBM/BM search window is taken from
+# the previous frame's disparity in that tile (optionally shifted by the global image motion), plus a margin.
+# A tile falls back to a full-range search of that tile alone (with its matching context) when the previous frame had
+# too few valid pixels there, or when the warm result loses valid pixels or piles up at the window edges. Tiles with
+# next to no valid pixels (sky, glare, no texture) are left invalid until the next keyframe. Every keyframe_every
+# frames, and after every gap in time (new burst), the frame is recomputed in full to bound drift.
+# Keyframes and every check_every-th frame are also matched in full to measure the speedup and the accuracy delta;
+# these go to <session>/disparity/warm_report.csv. Output is the same as batch_rectify.py (PNGs or the recon store).
+# Usage:
+#   python warm_disparity.py <calib_cv.mat | calib.npz> <session_dir> [<session_dir> ...]
+##################################
+import os
+import sys
+import time
+import cv2
+import numpy as np
+from multiprocessing import Pool
+from batch_rectify import (DisparityRange, load_calib, rect_maps, create_matcher, rectify_pair, disparity_to_png,
+                           session_tasks, nworkers)
+from recon_store import ReconStore
+
+## Inputs
+keyframe_every = 25             # frames between full-range keyframes
+max_gap = 0.5                   # a time gap longer than this (s) starts a new keyframe
+tile_size = (128, 256)         # rows, cols of the tiles with their own search window
+margin = 4                      # disparity margin (px) around the previous frame's range in a tile
+min_valid = 0.2                 # previous tile valid fraction below which the tile is searched in full ...
+skip_valid = 0.02               # ... or left invalid until the next keyframe, below this
+fallback_drop = 0.7             # search a tile in full if its valid fraction drops below this x the previous one
+edge_frac = 0.05                # ... or if more than this fraction of its pixels sit on the window edges
+motion_comp = 1                 # shift the previous disparity by the global image motion (phase correlation)
+check_every = 10                # also run a full search on every nth frame to measure accuracy (0 = keyframes only)
+use_store = 0                   # write disparity to <session>/recon (1) or to 16-bit PNGs (0)
+
+report_header = 'k,image_num,keyframe,checked,t_warm,t_full,tiles_full,mean_abs_diff,bad1,valid_warm,valid_full,tiles_skipped'
+
+invalid16 = (DisparityRange[0] - 1) * 16       # OpenCV's invalid value for the full range
+
+# Per-worker state
+_maps = None
+_matcher = None
+
+def _init(fname_maps):
+    global _maps, _matcher
+    _maps = dict(np.load(fname_maps))
+    _matcher = create_matcher()
+    cv2.setNumThreads(1)
+
+def full_disparity(J1, J2):
+    _matcher.setMinDisparity(DisparityRange[0])
+    _matcher.setNumDisparities(-(-(DisparityRange[1] - DisparityRange[0]) // 16) * 16)
+    return _matcher.compute(J1, J2)
+
+# Function to get the search window (min disparity, number of disparities) for a tile from the previous disparity,
+# or None where the tile should be searched in full
+def tile_window(prev):
+    valid = prev > invalid16
+    if valid.mean() < min_valid:
+        return None
+    lo, hi = np.percentile(prev[valid], [5, 95]) / 16
+    lo = max(int(np.floor(lo)) - margin, DisparityRange[0])
+    nd = -(-(int(np.ceil(hi)) + margin - lo) // 16) * 16
+    if nd >= DisparityRange[1] - DisparityRange[0]:
+        return None                             # No narrower than the full range
+    return lo, nd
+
+# Function to match one tile (rows r0:r1, cols c0:c1) with a given window. The matcher sees the tile plus the context it
+# needs (a block around it and lo + nd columns to the left); the result is coded as for the full range.
+def tile_disparity(J1, J2, r0, r1, c0, c1, lo, nd):
+    pad = _matcher.getBlockSize()
+    a, b = max(r0 - pad, 0), min(r1 + pad, J1.shape[0])
+    l, r = max(c0 - lo - nd - pad, 0), min(c1 + pad, J1.shape[1])
+    _matcher.setMinDisparity(lo)
+    _matcher.setNumDisparities(nd)
+    d = _matcher.compute(J1[a:b, l:r], J2[a:b, l:r])[r0 - a:r1 - a, c0 - l:c1 - l]
+    d[d < lo * 16] = invalid16
+    return d
+
+# Function to shift the previous disparity by the motion between the previous and current left frames
+def motion_compensate(prev_disp, prev_J1, J1):
+    s = 4                                       # Estimated on a 4x downsampled frame
+    a = cv2.resize(prev_J1, None, fx=1 / s, fy=1 / s, interpolation=cv2.INTER_AREA).astype(np.float32)
+    b = cv2.resize(J1, None, fx=1 / s, fy=1 / s, interpolation=cv2.INTER_AREA).astype(np.float32)
+    (dx, dy), response = cv2.phaseCorrelate(a, b)
+    if response < 0.1:
+        return prev_disp
+    M = np.float32([[1, 0, dx * s], [0, 1, dy * s]])
+    return cv2.warpAffine(prev_disp, M, (prev_disp.shape[1], prev_disp.shape[0]), flags=cv2.INTER_NEAREST,
+                          borderMode=cv2.BORDER_CONSTANT, borderValue=invalid16)
+
+# Function to match a frame tile by tile with windows from the previous disparity. Tiles that fall back are searched
+# over the full range on their own. Returns the disparity and the numbers of tiles that fell back and were skipped.
+def warm_disparity(J1, J2, prev):
+    disp = np.full(J1.shape, invalid16, np.int16)
+    nd_full = -(-(DisparityRange[1] - DisparityRange[0]) // 16) * 16
+    nfull, nskip = 0, 0
+    for r0 in range(0, J1.shape[0], tile_size[0]):
+        for c0 in range(0, J1.shape[1], tile_size[1]):
+            r1, c1 = min(r0 + tile_size[0], J1.shape[0]), min(c0 + tile_size[1], J1.shape[1])
+            p = prev[r0:r1, c0:c1]
+            if (p > invalid16).mean() < skip_valid:
+                nskip += 1                      # Stays invalid until the next keyframe
+                continue
+            win = tile_window(p)
+            if win is not None:
+                d = tile_disparity(J1, J2, r0, r1, c0, c1, *win)
+                valid = d > invalid16
+                edges = (d <= win[0] * 16) | (d >= (win[0] + win[1] - 1) * 16)
+                if valid.mean() >= fallback_drop * (p > invalid16).mean() and (edges & valid).mean() <= edge_frac:
+                    disp[r0:r1, c0:c1] = d
+                    continue
+            disp[r0:r1, c0:c1] = tile_disparity(J1, J2, r0, r1, c0, c1, DisparityRange[0], nd_full)
+            nfull += 1
+    return disp, nfull, nskip
+
+# Function to compare a warm disparity with the full search: mean |difference| (px) and fraction > 1 px where both are
+# valid, and the valid fraction of each
+def accuracy(warm, full):
+    both = (warm > invalid16) & (full > invalid16)
+    diff = np.abs(warm[both].astype(np.float32) - full[both]) / 16
+    return (float(diff.mean()) if diff.size else np.nan, float((diff > 1).mean()) if diff.size else np.nan,
+            float((warm > invalid16).mean()), float((full > invalid16).mean()))
+
+# Function to process one segment (a keyframe and the frames after it) in order
+def _segment(tasks):
+    out = []
+    prev, prev_J1 = None, None
+    for j, (k, (left_path, right_path, out_path, pair)) in enumerate(tasks):
+        J1, J2 = rectify_pair(cv2.imread(left_path, cv2.IMREAD_GRAYSCALE), cv2.imread(right_path, cv2.IMREAD_GRAYSCALE), _maps)
+        key, check = j == 0, j == 0 or (check_every and k % check_every == 0)
+        t_warm, nfull, nskip, full, t_full = np.nan, 0, 0, None, np.nan
+        if check:
+            t0 = time.time()
+            full = full_disparity(J1, J2)
+            t_full = time.time() - t0
+        if key:
+            disp = full
+        else:
+            t0 = time.time()
+            if motion_comp:
+                prev = motion_compensate(prev, prev_J1, J1)
+            disp, nfull, nskip = warm_disparity(J1, J2, prev)
+            t_warm = time.time() - t0
+        acc = accuracy(disp, full) if check and not key else (np.nan,) * 4
+        if out_path is not None:
+            cv2.imwrite(out_path + '.tmp.png', disparity_to_png(disp))
+            os.replace(out_path + '.tmp.png', out_path)
+        out.append(([k, pair[0], int(key), int(bool(check)), t_warm, t_full, nfull] + list(acc) + [nskip], pair,
+                    disp if out_path is None else None))
+        prev, prev_J1 = disp, J1
+    return out
+
+# Function to split a session's tasks into segments starting at keyframes (every keyframe_every frames or after a gap)
+def segments(tasks):
+    segs = []
+    for k, task in enumerate(tasks):
+        t = task[3][1]
+        if not segs or len(segs[-1]) >= keyframe_every or t - segs[-1][-1][1][3][1] > max_gap:
+            segs.append([])
+        segs[-1].append((k, task))
+    return segs
+
+def run_sessions(fname_calib, sessions):
+    calib = load_calib(fname_calib)
+    cache_dir = os.path.join(os.path.dirname(os.path.abspath(fname_calib)), 'rectmaps')
+    rows, cols = calib['imageSize']
+    fname_maps = rect_maps(calib, (cols, rows), cache_dir)
+    Q = np.load(fname_maps)['Q']
+    with Pool(nworkers, initializer=_init, initargs=(fname_maps,)) as pool:
+        for session in sessions:
+            out_dir = os.path.join(session, 'disparity')
+            os.makedirs(out_dir, exist_ok=True)
+            np.savetxt(os.path.join(out_dir, 'Q.txt'), Q)
+            store = ReconStore(session, Q, (rows, cols), DisparityRange, fname_maps, mode='a') if use_store else None
+            tasks, npairs = session_tasks(session, out_dir, store)
+            segs = segments(tasks)
+            print(f"{session}: {len(tasks)} of {npairs} pairs to do in {len(segs)} segments")
+            report = []
+            t0 = time.time()
+            for out in pool.imap(_segment, segs):            # In order, so the store stays in time order
+                for row, pair, disp16 in out:
+                    report.append(row)
+                    if store is not None:
+                        store.append(*pair, disp16)
+            if store is not None:
+                store.close()
+            if not report:
+                continue
+            with open(os.path.join(out_dir, 'warm_report.csv'), 'w') as f:
+                f.write(report_header + '\n')
+                f.writelines(','.join(f"{v:.6g}" if isinstance(v, float) else str(v) for v in r) + '\n' for r in report)
+            r = np.array([row[4:] for row in report], dtype=np.float64)
+            warm = np.isfinite(r[:, 0])
+            print(f"    {len(tasks) / (time.time() - t0):.2f} frames/s total")
+            if warm.any() and np.isfinite(r[:, 1]).any():
+                print(f"    warm {np.nanmean(r[:, 0]):.3f} s/frame, full {np.nanmean(r[:, 1]):.3f} s/frame, "
+                      f"speedup {np.nanmean(r[:, 1]) / np.nanmean(r[:, 0]):.2f}x, "
+                      f"{r[warm, 2].mean() / (-(-rows // tile_size[0]) * -(-cols // tile_size[1])):.1%} of tiles fell back to full search, "
+                      f"{r[warm, 7].mean() / (-(-rows // tile_size[0]) * -(-cols // tile_size[1])):.1%} left invalid")
+            if np.isfinite(r[:, 3]).any():
+                print(f"    vs full search: mean |diff| {np.nanmean(r[:, 3]):.3f} px, {np.nanmean(r[:, 4]):.2%} of pixels > 1 px, "
+                      f"valid {np.nanmean(r[:, 5]):.1%} (full {np.nanmean(r[:, 6]):.1%})")
+
+if __name__ == '__main__':
+    run_sessions(sys.argv[1], sys.argv[2:])
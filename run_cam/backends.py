@@ -0,0 +1,30 @@
+# Last updated: 2026-10-17
+##################################
+# Hardware backends for run_cam. On the Pi these are picamera2, gpiozero and vnpy; with STOKE_SIM=1 in the
+# environment they are the simulated cameras, buttons, LEDs and VN-200 from sim.py, so the acquisition code can be run
+# and benchmarked off the Pi. The hardware libraries are only imported when they are used.
+##################################
+import os
+
+SIM = os.environ.get('STOKE_SIM', '0') == '1'
+
+if SIM:
+    from sim import SimPicamera2 as Picamera2, SimButton as Button, SimLED as LED, SimEzAsyncData as EzAsyncData
+else:
+    def Picamera2(*args, **kwargs):
+        from picamera2 import Picamera2
+        return Picamera2(*args, **kwargs)
+
+    def Button(*args, **kwargs):
+        from gpiozero import Button
+        return Button(*args, **kwargs)
+
+    def LED(*args, **kwargs):
+        from gpiozero import LED
+        return LED(*args, **kwargs)
+
+    class EzAsyncData:
+        @staticmethod
+        def connect(*args, **kwargs):
+            from vnpy import EzAsyncData
+            return EzAsyncData.connect(*args, **kwargs)
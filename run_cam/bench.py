@@ -0,0 +1,142 @@
+# Last updated: 2026-10-17
+##################################
+# Benchmarks of the acquisition stack on the simulated hardware (sim.py), so changes can be checked off the Pi:
+#   burst_<mode>    standby burst throughput, missed slots, dropped frames, cam0/cam1 skew and write bandwidth for each
+#                   shooting mode in settings.py (dt, writer_threads and ring_frames from inputs.yaml)
+#   format_<fmt>    write bandwidth for each session_format
+#   imu_<rate>      IMU logger (imulog.log_async) sample rate against a replayed VN-200 stream
+#   vnmgr_<rate>    the same through the VN-200 manager (vnmanager.py) and its socket stream (imulog.log_stream)
+# Each case is run `repeats` times and the median kept. Results are compared with bench_baseline.json; a metric worse
+# than the baseline by more than its tolerance (relative) plus its slack (absolute) is a regression and the exit code
+# is 1. The first run on a machine (no bench_baseline.json yet) saves its results as the baseline; --save replaces it.
+# Baselines are per machine and are not committed; make the reference one on the Pi.
+# Usage:
+#   python bench.py [--save] [duration_s]
+##################################
+import os
+import sys
+import json
+import time
+import shutil
+import threading
+import platform
+import tempfile
+import numpy as np
+import yaml
+from sim import SimPicamera2, SimEzAsyncData
+from settings import modes, get_config
+from capture import CaptureEngine
+from writer import FrameWriter
+from sessionfile import SessionFile
+from imulog import log_async, log_stream
+from vnmanager import VNManager, Subscriber
+
+fname_baseline = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bench_baseline.json')
+repeats = 3
+metrics = {'fps': (1, 0.05, 0.5), 'missed_frac': (-1, 0, 0.05), 'dropped_frac': (-1, 0, 0.05),   # (direction, tolerance, slack)
+           'skew_ms_p99': (-1, 0.1, 2.0), 'write_MBps': (1, 0.2, 1.0), 'imu_hz': (1, 0.02, 2.0)}
+
+def dir_bytes(fdir):
+    return sum(os.path.getsize(os.path.join(root, f)) for root, _, files in os.walk(fdir) for f in files)
+
+# Function to run one standby burst on simulated cameras and measure it
+def bench_burst(mode, dt, writer_threads, ring_frames, duration, session_format='files'):
+    fdir = tempfile.mkdtemp(prefix='stoke_bench_') + '/'
+    cams = [SimPicamera2(0), SimPicamera2(1)]
+    config = get_config(mode, cams[0])
+    for cam in cams:
+        cam.configure(config)
+        cam.start()
+    sinks = None
+    if session_format != 'files':
+        sinks = [SessionFile(f"{fdir}cam{idx}.stk", idx, config['main'].get('format', 'BGR888')) for idx in (0, 1)]
+    writer = FrameWriter(config, ring_frames, writer_threads, sinks=sinks, encoding=session_format) if writer_threads else None
+    engine = CaptureEngine(cams, dt, [fdir, fdir], writer)
+    t0 = time.time()
+    engine.start()
+    time.sleep(duration)
+    engine.stop()
+    rep = engine.report()
+    engine.close()
+    if writer:
+        writer.close()
+    if sinks:
+        [sink.close() for sink in sinks]
+    elapsed = time.time() - t0                              # Including draining the writer
+    skew = [abs(r[4] - r[5]) / 1e6 for r in engine.records]
+    nslots = max(rep['frames'] + rep['missed'], 1)
+    out = {'fps': rep['fps'], 'missed_frac': rep['missed'] / nslots, 'dropped_frac': rep['dropped'] / (2 * nslots),
+           'skew_ms_p99': float(np.percentile(skew, 99)) if skew else 0.0, 'write_MBps': dir_bytes(fdir) / elapsed / 1e6}
+    [cam.close() for cam in cams]
+    shutil.rmtree(fdir)
+    return out
+
+def bench_imu(rate, duration):
+    fname = tempfile.mktemp(suffix='.bin')
+    tend = time.time() + duration
+    n = log_async(SimEzAsyncData(rate=rate), fname, lambda: time.time() < tend)
+    os.remove(fname)
+    return {'imu_hz': n / duration}
+
+def bench_vnmanager(rate, duration):
+    fdir = tempfile.mkdtemp(prefix='stoke_bench_')
+    manager = VNManager(SimEzAsyncData(rate=rate), None, f"{fdir}/vn.state", f"{fdir}/vn.sock")
+    stop = threading.Event()
+    thread = threading.Thread(target=manager.run, args=(lambda: not stop.is_set(),))
+    thread.start()
+    sub = Subscriber(f"{fdir}/vn.sock")
+    tend = time.time() + duration
+    n = log_stream(sub, f"{fdir}/imu.bin", lambda: time.time() < tend)
+    sub.close()
+    stop.set(), thread.join()
+    manager.close()
+    shutil.rmtree(fdir)
+    return {'imu_hz': n / duration}
+
+def run(duration):
+    with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'inputs.yaml')) as f:
+        inputs = yaml.safe_load(f)
+    dt, nthreads, nslots = inputs['dt'], inputs['writer_threads'], inputs['ring_frames']
+    cases = {f"burst_{mode}": (bench_burst, (mode, dt, nthreads, nslots, duration)) for mode in modes}
+    cases.update({f"format_{fmt}": (bench_burst, ('auto', dt, nthreads, nslots, duration, fmt)) for fmt in ('files', 'raw', 'jpeg')})
+    cases.update({f"imu_{rate}": (bench_imu, (rate, duration)) for rate in (200, 800)})
+    cases.update({f"vnmgr_{rate}": (bench_vnmanager, (rate, duration)) for rate in (200, 800)})
+    results = {}
+    for case, (fun, args) in cases.items():
+        runs = [fun(*args) for _ in range(repeats)]
+        results[case] = {k: float(np.median([r[k] for r in runs])) for k in runs[0]}
+    return {'machine': {'node': platform.node(), 'machine': platform.machine(), 'cpus': os.cpu_count(),
+                        'python': platform.python_version()},
+            'inputs': {'dt': dt, 'writer_threads': nthreads, 'ring_frames': nslots, 'duration': duration, 'repeats': repeats},
+            'time': time.strftime('%Y-%m-%d %H:%M:%S'), 'results': results}
+
+# Function to list the metrics that regressed against a baseline
+def compare(res, base):
+    regressions = []
+    for case, vals in res['results'].items():
+        for k, v in vals.items():
+            b = base['results'].get(case, {}).get(k)
+            if b is None:
+                continue
+            sign, tol, slack = metrics[k]
+            if (sign > 0 and v < b * (1 - tol) - slack) or (sign < 0 and v > b * (1 + tol) + slack):
+                regressions.append(f"{case} {k}: {v:.3f} (baseline {b:.3f})")
+    return regressions
+
+if __name__ == '__main__':
+    args = [a for a in sys.argv[1:] if not a.startswith('--')]
+    res = run(float(args[0]) if args else 2.0)
+    for case, vals in res['results'].items():
+        print(f"{case:16s} " + ', '.join(f"{k} {v:.3f}" for k, v in vals.items()))
+    if '--save' in sys.argv or not os.path.exists(fname_baseline):
+        with open(fname_baseline, 'w') as f:
+            json.dump(res, f, indent=2)
+        print(f"Saved baseline to {fname_baseline}")
+        sys.exit(0)
+    with open(fname_baseline) as f:
+        base = json.load(f)
+    if base['machine'] != res['machine'] or base['inputs'] != res['inputs']:
+        print(f"Warning: baseline is from {base['machine']} with {base['inputs']}")
+    regressions = compare(res, base)
+    print('\n'.join(['Regressions:'] + regressions) if regressions else 'No regressions')
+    sys.exit(1 if regressions else 0)
@@ -0,0 +1,210 @@
+# Last updated: 2026-10-17
+##################################
+# Synchronized capture engine for standby bursts and calibration shots.
+# One long-lived worker per camera. Workers meet at a shared barrier, the barrier action books the next
+# slot on a fixed-rate schedule (t0 + k*dt), and each worker sleeps until that slot before capturing.
+# Slots that are missed because a capture overran are skipped, so the schedule never drifts with encode time.
+# Given a FrameWriter (writer.py), frames are copied into its ring and encoded off the capture path.
+# Given a Telemetry (telemetry.py), every frame and skipped slot is also recorded with its timings.
+# A capture or save that raises loses that pair (counted in failed); a camera failing max_consecutive_errors frames in
+# a row stops the workers (error is set) and stop()/wait() return instead of blocking.
+# Works with any Picamera2-like object (see sim.py for an off-Pi backend).
+##################################
+import math
+import time
+import threading
+from datetime import datetime, timezone
+
+class CaptureEngine:
+    def __init__(self, cams, dt, fdirs, writer=None, telemetry=None, digits=5):
+        self.cams = cams                        # [cam0, cam1]
+        self.dt = dt                            # Frame period in seconds
+        self.fdirs = fdirs                      # [fdir_cam0, fdir_cam1] (with trailing '/')
+        self.writer = writer                    # Optional FrameWriter; None = save in the capture thread
+        self.telemetry = telemetry              # Optional Telemetry
+        self.digits = digits                    # Zero-padded width of the image number in file names
+        self.records = []                       # One row per captured pair (see commit_frame)
+        self.missed = 0                         # Schedule slots skipped because a capture overran
+        self.failed = 0                         # Pairs lost because a camera's capture or save raised
+        self.errors = [0] * len(cams)           # Capture/save exceptions per camera (whole lifetime)
+        self.error = None                       # Fatal error that stopped the workers
+        self.max_consecutive_errors = 5         # A camera failing this many frames in a row is fatal
+        self._dropped0 = 0                      # Writer drop count at the start of the burst
+        self._errors0 = 0                       # Writer error count at the start of the burst
+        self._armed = threading.Event()         # Set while a burst is running
+        self._done = threading.Event()          # Set when the workers have parked after a burst
+        self._alive = True
+        self._go = False
+        self._lock = threading.Lock()           # Guards the schedule between start() and the barrier action
+        self._limit = None                      # Stop after this many frames (None = until stop())
+        self._i = 0                             # Image number of the current frame (0-based)
+        self._k = -1                            # Index of the current schedule slot
+        self._t0 = 0.0                          # Epoch time of slot 0
+        self._tnext = 0.0                       # Epoch time of the current slot
+        self._last = [None] * len(cams)         # (host_time, sensor_ns, capture_s) of each cam's last frame, False if it failed
+        self._barrier = threading.Barrier(len(cams), action=self._next_slot)
+        self._workers = [threading.Thread(target=self._worker, args=[idx], daemon=True) for idx in range(len(cams))]
+        [w.start() for w in self._workers]
+
+    def _next_slot(self):
+        # Runs once per frame, in one worker, after every worker has finished the previous frame
+        with self._lock:
+            self._book_slot()
+
+    def _book_slot(self):
+        if self._k >= 0:
+            if all(self._last):
+                self.commit_frame()
+            else:
+                self.failed += 1
+                self._last = [None] * len(self.cams)
+            self._i += 1
+        self._go = self._armed.is_set() and (self._limit is None or self._i < self._limit)
+        if not self._go:
+            self._k = -1
+            self._done.set()
+            return
+        tnow = time.time()
+        if self._k < 0:                         # First slot of a burst: at t0, or now if t0 has passed (delay=0)
+            self._t0 = max(self._t0, tnow)
+            k = 0
+        else:
+            k = max(self._k + 1, math.ceil((tnow - self._t0) / self.dt))
+        if self._k >= 0 and k > self._k + 1:
+            self.missed += k - self._k - 1
+            if self.telemetry:
+                self.telemetry.missed(k - self._k - 1, self._t0 + (self._k + 1) * self.dt)
+        self._k = k
+        self._tnext = self._t0 + k * self.dt
+
+    def _worker(self, idx):
+        cam = self.cams[idx]
+        consecutive = 0
+        while self._alive:
+            try:
+                self._barrier.wait()
+            except threading.BrokenBarrierError:
+                self._done.set()        # Aborted (close or a fatal error); let stop()/wait() return
+                return
+            if not self._go:
+                self._armed.wait(0.1)   # Park until the next burst (or shutdown)
+                continue
+            tsleep = self._tnext - time.time()
+            if tsleep > 0:
+                time.sleep(tsleep)
+            tnow = datetime.now(timezone.utc)
+            tstr = tnow.strftime('%H%M%S%f')
+            t_req, sensor_ns, kept = time.time(), 0, False
+            try:
+                request = cam.capture_request()
+                try:
+                    t_req = time.time()
+                    sensor_ns = request.get_metadata().get('SensorTimestamp', 0)
+                    fname = f"{self.fdirs[idx]}{idx}_{tstr}_{self._i+1:0{self.digits}}.jpg"
+                    if self.writer is None:
+                        request.save('main', fname)
+                        kept = True
+                    else:
+                        kept = self.writer.write_request(idx, request, fname, tnow, self._i + 1)
+                finally:
+                    request.release()
+                failed, consecutive = False, 0
+            except Exception as e:      # Lose this camera's frame (and so the pair), not the engine
+                failed, consecutive = True, consecutive + 1
+                self.errors[idx] += 1
+                if consecutive >= self.max_consecutive_errors:
+                    self.error = e
+            t_done = time.time()
+            self._last[idx] = False if failed else (tnow.timestamp(), sensor_ns, t_done - tnow.timestamp())
+            if self.telemetry:
+                self.telemetry.capture(idx, self._i + 1, self._tnext, tnow.timestamp(), sensor_ns, t_req - tnow.timestamp(),
+                                       t_done - t_req, self.writer.depth() if self.writer else 0, 2 if failed else int(not kept))
+            if self.error is not None:
+                self._barrier.abort()   # Fatal: the other worker leaves the barrier too
+                self._done.set()
+                return
+
+    def commit_frame(self):
+        # (image number, scheduled time, host time cam0, host time cam1, sensor ns cam0, sensor ns cam1, capture s cam0, capture s cam1)
+        (h0, s0, c0), (h1, s1, c1) = self._last[0], self._last[1]
+        self.records.append((self._i + 1, self._tnext, h0, h1, s0, s1, c0, c1))
+        self._last = [None] * len(self.cams)
+
+    def start(self, nframes=None, i0=0, delay=None):
+        # Start a burst at image number i0+1, first slot `delay` (default one period) from now (clears the previous report)
+        with self._lock:
+            self._i, self._k = i0, -1
+            self._limit = None if nframes is None else i0 + nframes
+            self._t0 = time.time() + (self.dt if delay is None else delay)
+            self._last = [None] * len(self.cams)
+            self.records, self.missed, self.failed = [], 0, 0
+            self._dropped0 = sum(self.writer.dropped) if self.writer else 0
+            self._errors0 = sum(self.writer.errors) if self.writer else 0
+            if self._barrier.broken:
+                return                          # Workers stopped after a fatal error; stop()/wait() return at once
+            self._done.clear()
+            self._armed.set()
+
+    def stop(self):
+        # Finish the frame in flight and park the workers
+        self._armed.clear()
+        self._done.wait()
+
+    def wait(self):
+        # Block until a burst started with start(nframes) has captured all of its frames
+        self._done.wait()
+        self._armed.clear()
+
+    def capture_pair(self, i):
+        # Single synchronized shot with image number i+1 (used by calibration)
+        self.start(nframes=1, i0=i, delay=0)
+        self.wait()
+
+    def report(self):
+        n = len(self.records)
+        dropped = sum(self.writer.dropped) - self._dropped0 if self.writer else 0
+        write_errors = sum(self.writer.errors) - self._errors0 if self.writer else 0
+        if n < 2:
+            return {'frames': n, 'fps': 0.0, 'missed': self.missed, 'dropped': dropped, 'failed': self.failed,
+                    'write_errors': write_errors, 'skew_ms_median': 0.0, 'skew_ms_max': 0.0}
+        host = [min(r[2], r[3]) for r in self.records]
+        fps = (n - 1) / (host[-1] - host[0]) if host[-1] > host[0] else 0.0
+        if all(r[4] and r[5] for r in self.records):
+            skew = sorted(abs(r[4] - r[5]) / 1e6 for r in self.records)   # Sensor timestamps (ns)
+        else:
+            skew = sorted(abs(r[2] - r[3]) * 1e3 for r in self.records)   # Fall back to host times
+        return {'frames': n, 'fps': fps, 'missed': self.missed, 'dropped': dropped, 'failed': self.failed,
+                'write_errors': write_errors, 'skew_ms_median': skew[n // 2], 'skew_ms_max': skew[-1]}
+
+    def close(self):
+        self._alive = False
+        self._armed.set()
+        self._barrier.abort()
+        [w.join() for w in self._workers]
+
+if __name__ == '__main__':
+    # Off-Pi check of the engine against the simulated cameras
+    import sys
+    import tempfile
+    from sim import SimPicamera2
+    from writer import FrameWriter
+    from telemetry import Telemetry, load, summarize
+    dt = float(sys.argv[1]) if len(sys.argv) > 1 else 0.04
+    nthreads = int(sys.argv[2]) if len(sys.argv) > 2 else 0     # Writer threads (0 = save in the capture thread)
+    fdir = tempfile.mkdtemp() + '/'
+    cams = [SimPicamera2(0), SimPicamera2(1)]
+    [cam.configure(cam.create_still_configuration()) for cam in cams]
+    [cam.start() for cam in cams]
+    telemetry = Telemetry(fdir + 'telemetry.bin')
+    writer = FrameWriter(cams[0].camera_configuration(), nthreads=nthreads, telemetry=telemetry) if nthreads else None
+    engine = CaptureEngine(cams, dt, [fdir, fdir], writer, telemetry)
+    engine.start()
+    time.sleep(2)
+    engine.stop()
+    print(engine.report())
+    engine.close()
+    if writer:
+        writer.close()
+    [cam.close() for cam in cams]
+    telemetry.close()
+    print(summarize(load(fdir), dt))
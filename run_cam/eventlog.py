@@ -0,0 +1,117 @@
+# Last updated: 2026-10-17
+##################################
+# Non-blocking event log shared by the acquisition scripts (master.py, imu.py, utils.py, quicklook.py).
+# Callers put events (time, message) on an in-memory queue and return immediately; one writer thread per process
+# formats them and appends them to the daily _LOG.txt in batches, at most flush_dt after the first event of a batch.
+# Each batch is a single write() on an O_APPEND descriptor, so lines from master.py and imu.py never interleave.
+# Logs are flushed at exit and, with flush_on_signal, on SIGTERM. If the queue is full, events are dropped and counted
+# rather than blocking the caller.
+# Usage:
+#   log = get_log(fname_log)
+#   log.event('Entering standby...', blank=1)      -> "HHMMSSffffff:     Entering standby...\n\n"
+##################################
+import os
+import sys
+import time
+import queue
+import atexit
+import signal
+import threading
+from datetime import datetime, timezone
+
+class EventLog:
+    def __init__(self, fname, flush_dt=0.5, maxsize=10000):
+        self.fname = fname
+        self.flush_dt = flush_dt                # Max time an event waits in memory (s)
+        self.maxsize = maxsize                  # Events held in memory before new ones are dropped
+        self.dropped = 0
+        self._q = queue.SimpleQueue()           # Reentrant put, so events can be logged from signal handlers
+        self._fd = None
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def event(self, msg, blank=0):
+        # Log "<HHMMSSffffff>:     msg" followed by `blank` empty lines
+        self._put((time.time(), msg, blank))
+
+    def raw(self, text):
+        self._put(text)
+
+    def _put(self, item):
+        if self._closed or self._q.qsize() >= self.maxsize:
+            self.dropped += 1
+            return
+        self._q.put(item)
+
+    def _format(self, item):
+        if isinstance(item, str):
+            return item
+        t, msg, blank = item
+        return f"{datetime.fromtimestamp(t, timezone.utc).strftime('%H%M%S%f')}:     {msg}\n" + '\n' * blank
+
+    def _run(self):
+        while True:
+            batch = [self._q.get()]
+            t_end = time.monotonic() + self.flush_dt
+            while isinstance(batch[-1], (str, tuple)):     # Flush and close markers end the batch
+                try:
+                    batch.append(self._q.get(timeout=max(t_end - time.monotonic(), 0)))
+                except queue.Empty:
+                    break
+            text = ''.join(self._format(item) for item in batch if isinstance(item, (str, tuple)))
+            if text:
+                if self._fd is None:
+                    self._fd = os.open(self.fname, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+                os.write(self._fd, text.encode())
+            if isinstance(batch[-1], threading.Event):
+                batch[-1].set()
+            elif batch[-1] is None:
+                if self._fd is not None:
+                    os.close(self._fd)
+                return
+
+    def flush(self, timeout=2.0):
+        # Block until every event logged so far is written (or timeout)
+        if self._closed:
+            return
+        done = threading.Event()
+        self._q.put(done)
+        done.wait(timeout)
+
+    def close(self, timeout=2.0):
+        if self._closed:
+            return
+        if self.dropped:
+            self.event(f"Event log: {self.dropped} events dropped (queue full)")
+        self._closed = True
+        self._q.put(None)
+        self._thread.join(timeout)
+
+_logs = {}
+_lock = threading.Lock()
+
+# Function to get this process's EventLog for a log file (created on first use, closed at exit)
+def get_log(fname):
+    with _lock:
+        if fname not in _logs:
+            _logs[fname] = EventLog(fname)
+        return _logs[fname]
+
+def close_all():
+    [log.close() for log in list(_logs.values())]
+
+atexit.register(close_all)
+
+# Function to flush every log when signum arrives, then run the previous handler (or exit, if it was the default)
+def flush_on_signal(signum=signal.SIGTERM):
+    previous = signal.getsignal(signum)
+
+    def handler(sig, frame):
+        [log.flush() for log in list(_logs.values())]
+        if callable(previous):
+            previous(sig, frame)
+        elif previous == signal.SIG_DFL:
+            sys.exit(128 + sig)                 # Runs the atexit close
+
+    signal.signal(signum, handler)
@@ -0,0 +1,116 @@
+# Last updated: 2026-10-17
+##################################
+# High-rate IMU logging from the VN-200 asynchronous binary output.
+# The sensor is set to push packets at imu_rate Hz; each packet from the EzAsyncData stream becomes one fixed-width
+# record (imu_dtype) in IMU_<session>.bin, written through a buffered file with a periodic fsync.
+# Usage (convert a .bin log to the imu_headerLine CSV written by imu.py):
+#   python imulog.py IMU_<session>.bin [IMU_<session>.txt]
+##################################
+import os
+import sys
+import time
+import numpy as np
+from datetime import datetime, timezone
+
+imu_headerLine = "Timestamp (UTC: HHMMSSsss), VN-200 Timestamp (UTC), Yaw (deg), Pitch (deg), Roll (deg), Accel_x, Accel_y, Accel_z, Gyro_x, Gyro_y, Gyro_z, Mag_x, Mag_y, Mag_z, GPS_LLA\n"
+
+imu_dtype = np.dtype([('host_us', '<i8'),                                            # Host receive time (us since epoch)
+                      ('year', 'u1'), ('month', 'u1'), ('day', 'u1'), ('hour', 'u1'),  # VN-200 UTC time
+                      ('minute', 'u1'), ('second', 'u1'), ('ms', '<u2'),
+                      ('ypr', '<f4', 3), ('accel', '<f4', 3), ('gyro', '<f4', 3), ('mag', '<f4', 3),
+                      ('lla', '<f8', 3)])
+imu_rate_max = 800                      # VN-200 IMU rate (Hz); the async rate is imu_rate_max / divisor
+chunk_rows = 256                        # Records buffered per write()
+
+def configure_async(s, imu_rate):
+    # Binary output 1 on the serial port: attitude, UTC time, uncompensated IMU (as read_imu_measurements), GPS LLA,
+    # satellites and position uncertainty
+    from vnpy import BinaryOutputRegister, AsyncMode, CommonGroup, TimeGroup, ImuGroup, GpsGroup, AttitudeGroup, InsGroup
+    divisor = max(1, round(imu_rate_max / imu_rate))
+    bor = BinaryOutputRegister(AsyncMode.PORT1, divisor,
+                               CommonGroup.YAWPITCHROLL,
+                               TimeGroup.TIMEUTC,
+                               ImuGroup.UNCOMPMAG | ImuGroup.UNCOMPACCEL | ImuGroup.UNCOMPGYRO,
+                               GpsGroup.POSLLA | GpsGroup.NUMSATS | GpsGroup.POSU,  # Fix status for vnmanager.py
+                               AttitudeGroup.NONE,
+                               InsGroup.NONE)
+    s.write_binary_output_1(bor)
+    return imu_rate_max / divisor
+
+def fill_row(row, host_us, cd):
+    row['host_us'] = host_us
+    if cd.has_time_utc:
+        t = cd.time_utc
+        row['year'], row['month'], row['day'] = t.year, t.month, t.day
+        row['hour'], row['minute'], row['second'], row['ms'] = t.hour, t.minute, t.second, t.ms
+    for field, attr in (('ypr', 'yaw_pitch_roll'), ('accel', 'acceleration_uncompensated'),
+                        ('gyro', 'angular_rate_uncompensated'), ('mag', 'magnetic_uncompensated'),
+                        ('lla', 'position_gps_lla')):
+        if getattr(cd, 'has_' + attr):
+            v = getattr(cd, attr)
+            row[field] = (v.x, v.y, v.z)
+
+def log_async(ez, fname_bin, running, fsync_dt=1.0):
+    # Drain packets until running() is False. Returns the number of records written.
+    buf = np.zeros(chunk_rows, dtype=imu_dtype)
+    n, total = 0, 0
+    tsync = time.time()
+    with open(fname_bin, 'ab', buffering=1 << 20) as f:
+        while running():
+            cd = ez.next_data(100)          # Blocks up to 100 ms for the next packet
+            if cd is None:
+                continue
+            fill_row(buf[n], int(time.time() * 1e6), cd)
+            n += 1
+            if n == chunk_rows:
+                f.write(buf.tobytes())
+                total, n = total + n, 0
+                buf[:] = 0
+            if time.time() - tsync > fsync_dt:
+                f.flush(), os.fsync(f.fileno())
+                tsync = time.time()
+        f.write(buf[:n].tobytes())
+        f.flush(), os.fsync(f.fileno())
+    return total + n
+
+def log_stream(sub, fname_bin, running, fsync_dt=1.0):
+    # As log_async, for the records streamed by the VN-200 manager (vnmanager.Subscriber)
+    total = 0
+    tsync = time.time()
+    with open(fname_bin, 'ab', buffering=1 << 20) as f:
+        while running():
+            try:
+                rec = sub.records(0.1)
+            except (EOFError, OSError):     # Manager stopped, or dropped this subscriber
+                break
+            f.write(rec.tobytes())
+            total += len(rec)
+            if time.time() - tsync > fsync_dt:
+                f.flush(), os.fsync(f.fileno())
+                tsync = time.time()
+        f.flush(), os.fsync(f.fileno())
+    return total
+
+def read_bin(fname_bin):
+    return np.fromfile(fname_bin, dtype=imu_dtype)
+
+# Function to format one record as a line of the imu_headerLine CSV
+def csv_row(r):
+    tstr = datetime.fromtimestamp(r['host_us'] / 1e6, timezone.utc).strftime('%H%M%S%f')
+    vn = f"20{r['year']:02}-{r['month']:02}-{r['day']:02}T{r['hour']:02}:{r['minute']:02}:{r['second']:02}.{r['ms']:03}"
+    ypr, acc, gyr, mag, lla = (r[k].tolist() for k in ('ypr', 'accel', 'gyro', 'mag', 'lla'))
+    return (f"{tstr}, {vn}, {ypr[0]}, {ypr[1]}, {ypr[2]}, {acc[0]}, {acc[1]}, {acc[2]}, {gyr[0]}, {gyr[1]}, {gyr[2]}, "
+            f"{mag[0]}, {mag[1]}, {mag[2]}, ({lla[0]}, {lla[1]}, {lla[2]})\n")
+
+def to_csv(fname_bin, fname_txt):
+    rec = read_bin(fname_bin)
+    with open(fname_txt, 'w') as imu:
+        imu.write(imu_headerLine)
+        for r in rec:
+            imu.write(csv_row(r))
+    return len(rec)
+
+if __name__ == '__main__':
+    fname_bin = sys.argv[1]
+    fname_txt = sys.argv[2] if len(sys.argv) > 2 else os.path.splitext(fname_bin)[0] + '.txt'
+    print(f"{fname_txt}: {to_csv(fname_bin, fname_txt)} rows")
@@ -1,73 +1,73 @@
-# Last updated: 2024-10-03
+# Last updated: 2026-10-17
 ##################################
 # This script allows the user to toggle through camera settings, launch standby mode, and capture images syncronously by holding right button.
 # The user can also calibrate the cameras by holding the left button for more than 5 seconds.
 ##################################
+import os
 import sys
 import time
-import threading
 import subprocess
-from vnpy import *
 from utils import *
 from settings import *
-from picamera2 import Picamera2
-from gpiozero import Button, LED
-from datetime import datetime, timezone, timedelta
+from capture import CaptureEngine
+from writer import FrameWriter
+from sessionfile import SessionFile
+from telemetry import Telemetry
+from eventlog import get_log, flush_on_signal
+from quicklook import QuickLook
+from pretrigger import PreTrigger
+from vnmanager import VNClient
+from backends import Picamera2, Button, LED
 
 def configure_cameras(fname_log, mode):
     global cam0, cam1, config 
-    tstr = datetime.now(timezone.utc).strftime('%H%M%S%f')
-    log = open(fname_log, 'a')
-    log.write(f"{tstr}:     Configuring cameras to {mode} mode...\n")
+    log = get_log(fname_log)
+    log.event(f"Configuring cameras to {mode} mode...")
     for idx, cam in enumerate([cam0, cam1]):
         cam.configure(config)
         cam.start()
-        log.write(f"{tstr}:     cam{idx} configuration: {cam.camera_configuration()}\n")
-        log.write(f"{tstr}:     cam{idx} metadata: {cam.capture_metadata()}\n")
-    log.write('\n'), log.close()
+        log.event(f"cam{idx} configuration: {cam.camera_configuration()}")
+        log.event(f"cam{idx} metadata: {cam.capture_metadata()}")
+    log.raw('\n')
 
 def calib(fdir, fname_log, calib_dt, calib_frames, mode):
     [led.on() for led in (red, green, yellow)]
     time.sleep(5)
     [led.off() for led in (red, green, yellow)]
     fdir_out, fdir_cam0, fdir_cam1, fname_imu = create_dirs(fdir, f"calib_{mode}")
-    log = open(fname_log, 'a')
-    tnow = datetime.now(timezone.utc)
-    tstr = tnow.strftime('%H%M%S%f')
-    log.write(f"{tstr}:     calibration_{mode} session: {fdir_out}\n"), log.close()
+    get_log(fname_log).event(f"calibration_{mode} session: {fdir_out}")
     imu_process = subprocess.Popen(['python3', 'imu.py', fname_imu, fname_log])
+    telemetry = Telemetry(f"{fdir_out}telemetry.bin")
+    engine = CaptureEngine([cam0, cam1], calib_dt, [fdir_cam0, fdir_cam1], telemetry=telemetry)
     for i in range(int(calib_frames)):
         green.on(), time.sleep(0.5)
         yellow.on(), time.sleep(0.5)
         red.on(), time.sleep(0.5)
         [led.blink(0.5,0.5) for led in (red, green, yellow)], time.sleep(3)
         [led.on() for led in (red, green, yellow)],time.sleep(1.5)
-        p0 = threading.Thread(target=cap0, args=[fdir_cam0, tnow, i])
-        p1 = threading.Thread(target=cap1, args=[fdir_cam1, tnow, i]) 
-        p0.start(), p1.start()
-        p0.join(), p1.join()
+        engine.capture_pair(i)
         [led.off() for led in (red, green, yellow)]
         time.sleep(calib_dt)
+    engine.close()
+    telemetry.close()
     imu_process.terminate()
 
 def monitor_gps():
-    ez = EzAsyncData.connect('/dev/ttyUSB0', 115200) 
-    s = ez.sensor
-    if ez.current_data.has_any_position:                              
-        if ez.current_data.position_uncertainty_estimated > 10:
+    st = vn.state()                                 # Latest fix from the VN-200 manager, no reconnect
+    if vn.fresh(st) and st['has_position']:
+        if st['uncertainty'] > 10:
             green.blink(0.25, 0.25)
-        elif ez.current_data.position_uncertainty_estimated <= 10:
+        elif st['uncertainty'] <= 10:
             green.on()
     else:
         green.blink(0.5, 0.5) 
-    s.disconnect()
 
 def toggle_modes():
     global cam0, cam1, config, mode, shooting_modes
     [led.blink(0.1, 0.1) for led in (red, green, yellow)]
     time.sleep(3)
     [led.off() for led in (red, green, yellow)]
-    cam0.close(), cam1.close()                      # Close the cameras
+    old = mode
     idx = shooting_modes.index(mode)                # Get the index of the current mode
     while not (right_button.is_held and left_button.is_held):
         if right_button.is_pressed and not left_button.is_pressed:
@@ -81,123 +81,169 @@ def toggle_modes():
             red.on(), green.off(), yellow.off()
         time.sleep(0.2)
     [led.off() for led in (red, green, yellow)]
-    config = get_config(mode)                       # Get the configuration for the cameras
-    cam0 = Picamera2(0)                             # Initialize cam0       
-    cam1 = Picamera2(1)                             # Initialize cam1
-    configure_cameras(fname_log, mode)              # Configure the cameras
+    latency = switch_mode([cam0, cam1], config, configs[mode])     # Cameras stay open
+    how = 'reconfigured' if needs_configure(config, configs[mode]) else 'controls only'
+    config = configs[mode]
+    get_log(fname_log).event(f"Switched from {old} to {mode} mode in {latency * 1000:.0f} ms ({how})")
     [led.blink(0.1, 0.1) for led in (red, green, yellow)]
     time.sleep(3)
     [led.off() for led in (red, green, yellow)]
 
-def cap0(fdir_cam0, tnext, i):
-    tnow = datetime.now(timezone.utc)
-    while tnow < tnext:
-        tnow = datetime.now(timezone.utc)
-    tstr = tnow.strftime('%H%M%S%f')
-    cam0.capture_file(f"{fdir_cam0}0_{tstr}_{i+1:05}.jpg")
-
-def cap1(fdir_cam1, tnext, i):
-    tnow = datetime.now(timezone.utc)
-    while tnow < tnext:
-        tnow = datetime.now(timezone.utc)
-    tstr = tnow.strftime('%H%M%S%f')
-    cam1.capture_file(f"{fdir_cam1}1_{tstr}_{i+1:05}.jpg")
-
 def exit_standby(fname_log):
     global standby
     yellow.off(), red.off() # Close the lights
     time.sleep(2)
-    tstr = datetime.now(timezone.utc).strftime('%H%M%S%f')
-    log = open(fname_log, 'a')
-    log.write(f"{tstr}:     Exiting standby.\n\n"), log.close()
+    get_log(fname_log).event("Exiting standby.", blank=1)
     standby = False
 
 def enter_standby(fdir, fname_log, dt, mode):
     yellow.on()
-    log = open(fname_log, 'a')
-    tstr = datetime.now(timezone.utc).strftime('%H%M%S%f')
-    log.write(f"{tstr}:     Entering standby... \n\n"), log.close()
+    get_log(fname_log).event("Entering standby... ", blank=1)
     fdir_out, fdir_cam0, fdir_cam1, fname_imu = create_dirs(fdir, f"session_{mode}")
     imu_process = subprocess.Popen(['python3', 'imu.py', fname_imu, fname_log])
+    sinks = None
+    if session_format != 'files':                               # One append-only container per camera
+        sinks = [SessionFile(f"{fdir_out}cam{idx}.stk", idx, config['main'].get('format', 'BGR888')) for idx in (0, 1)]
+    telemetry = Telemetry(f"{fdir_out}telemetry.bin")           # Per-frame timings (summary: python telemetry.py <session>)
+    writer = FrameWriter(config, ring_frames, writer_threads, sinks=sinks, encoding=session_format, telemetry=telemetry) if writer_threads else None # JPEG encoding off the capture path
+    pretrigger = None
+    if pretrigger_s:                                            # Stream into a RAM ring; pressing writes the last pretrigger_s too
+        pretrigger = PreTrigger(config, pretrigger_s, dt, writer, mem_frac=pretrigger_mem)
+        get_log(fname_log).event(f"Pre-trigger buffer: {pretrigger.npairs} pairs ({pretrigger.seconds:.1f} s, "
+                                 f"{pretrigger.ring.nbytes / 2 ** 20:.0f} MB)")
+    # One capture worker per camera for the session. With the pre-trigger, image numbers run on over the whole standby,
+    # so they get 7 digits (over 4 days at 25 fps) instead of 5 (66 minutes).
+    engine = CaptureEngine([cam0, cam1], dt, [fdir_cam0, fdir_cam1], pretrigger or writer, telemetry, 7 if pretrigger else 5)
+    if pretrigger:
+        engine.start()                                          # Runs for the whole standby
+    quicklook = None
+    if quicklook_every and session_format == 'files' and writer:  # Low-priority disparity check of every Nth written pair
+        if os.path.exists(quicklook_calib):
+            quicklook = QuickLook(fdir_out, quicklook_calib, fname_log, writer, engine, quicklook_every, quicklook_downsample, quicklook_cpu)
+        else:
+            get_log(fname_log).event(f"Quick look off: calibration {quicklook_calib} not found")
     time.sleep(1)
+    tflush = time.time()
     while not (right_button.is_held and left_button.is_held): # Hold both buttons for 3 seconds to exit standby
-        if right_button.is_pressed and not left_button.is_pressed:  
-            i = 0
+        if right_button.is_pressed and not left_button.is_pressed and pretrigger:
+            red.on()
+            pretrigger.trigger()                                # Pre-roll to the writer, live frames from now on
+            right_button.wait_for_release()
+            pretrigger.release()
+            red.off()
+            get_log(fname_log).event(f"Burst: {pretrigger.preroll} pre-trigger pairs + {pretrigger.live // 2} live pairs (dt = {dt}), "
+                                     f"{engine.missed} missed slots, {sum(pretrigger.dropped)} dropped frames, {sum(engine.errors)} failed captures and {sum(pretrigger.errors)} write errors since standby")
+            if engine.error is not None:
+                get_log(fname_log).event(f"Capture stopped: {engine.error!r} (errors per camera: {engine.errors})")
+            telemetry.flush()
+        elif right_button.is_pressed and not left_button.is_pressed:  
             red.on()
-            while right_button.is_pressed:
-                tnow = datetime.now(timezone.utc)
-                tnext = tnow + timedelta(seconds=dt)
-                p0 = threading.Thread(target=cap0, args=[fdir_cam0, tnext, i])
-                p1 = threading.Thread(target=cap1, args=[fdir_cam1, tnext, i]) 
-                p0.start(), p1.start()
-                p0.join(), p1.join()
-                i += 1
+            engine.start()                                      # Burst runs on the dt schedule until release
+            right_button.wait_for_release()
+            engine.stop()
             red.off()
+            rep = engine.report()
+            get_log(fname_log).event(f"Burst: {rep['frames']} frames at {rep['fps']:.2f} fps (dt = {dt}), {rep['missed']} missed slots, {rep['dropped']} dropped frames, "
+                                     f"{rep['failed']} failed pairs, {rep['write_errors']} write errors{f' ({writer.last_error!r})' if rep['write_errors'] else ''}, cam0/cam1 skew median {rep['skew_ms_median']:.3f} ms, max {rep['skew_ms_max']:.3f} ms")
+            if engine.error is not None:
+                get_log(fname_log).event(f"Capture stopped: {engine.error!r} (errors per camera: {engine.errors})")
+            telemetry.flush()
+        if pretrigger and time.time() - tflush > 10:            # Frames keep being recorded while buffering
+            telemetry.flush()
+            tflush = time.time()
         time.sleep(0.2)
+    if quicklook:
+        quicklook.close()
+    if pretrigger:
+        engine.stop()
+        pretrigger.close()  # Hand over the last pre-roll before the writer drains
+    engine.close()
+    if writer:
+        writer.close()      # Drain the ring to disk
+    if sinks:
+        [sink.close() for sink in sinks]
+    telemetry.close()       # After the writer, so every frame's write time is in
     imu_process.terminate() # Terminate the imu process
     exit_standby(fname_log)
 
-############################ Initialization ############################
-green = LED(12)                         # Green LED
-yellow = LED(16)                        # Yellow LED
-red = LED(24)                           # Red LED
-right_button = Button(18, hold_time=3)  # Right button
-left_button = Button(17, hold_time=3)   # Left button
+if __name__ == '__main__':
+    ############################ Initialization ############################
+    green = LED(12)                         # Green LED
+    yellow = LED(16)                        # Yellow LED
+    red = LED(24)                           # Red LED
+    right_button = Button(18, hold_time=3)  # Right button
+    left_button = Button(17, hold_time=3)   # Left button
 
-fdir, fname_log = setup_logging()               # Setup logging
-inputs = read_inputs_yaml(fname_log)            # Read inputs from inputs.yaml
-dt = inputs['dt']
-calib_dt = inputs['calib_dt']
-calib_frames = inputs['calib_frames']
-gps_wait_time = inputs['gps_wait_time']
+    fdir, fname_log = setup_logging()               # Setup logging
+    flush_on_signal()                               # Write out queued log events on SIGTERM
+    inputs = read_inputs_yaml(fname_log)            # Read inputs from inputs.yaml
+    dt = inputs['dt']
+    calib_dt = inputs['calib_dt']
+    calib_frames = inputs['calib_frames']
+    gps_wait_time = inputs['gps_wait_time']
+    writer_threads = inputs['writer_threads']
+    ring_frames = inputs['ring_frames']
+    session_format = inputs['session_format'] if writer_threads else 'files' # Containers are filled by the writer threads
+    quicklook_every = inputs['quicklook_every']
+    quicklook_calib = inputs['quicklook_calib']
+    quicklook_downsample = inputs['quicklook_downsample']
+    quicklook_cpu = inputs['quicklook_cpu']
+    pretrigger_s = inputs['pretrigger_s']
+    pretrigger_mem = inputs['pretrigger_mem']
 
-sync_clock_and_imu(fname_log, gps_wait_time)    # Connect to VecNav and sync clock 
+    vn_process = subprocess.Popen(['python3', 'vnmanager.py', fname_log])  # Only process that opens the VN-200
+    try:
+        vn = VNClient()                                 # GPS status from the manager's shared state
+        sync_clock_and_imu(fname_log, gps_wait_time, vn) # Wait for a VecNav fix and sync clock 
 
-global cam0, cam1, config, mode, standby, shooting_modes
-shooting_modes = [inputs['shooting_mode0'], inputs['shooting_mode1'], inputs['shooting_mode2']]
-mode = shooting_modes[0]                        # Default to 'auto'
-config = get_config(mode)                       # Get the configuration for the cameras
-cam0 = Picamera2(0)                             # Initialize cam0       
-cam1 = Picamera2(1)                             # Initialize cam1
-configure_cameras(fname_log, mode)              # Configure the cameras
+        global cam0, cam1, config, configs, mode, standby, shooting_modes
+        shooting_modes = [inputs['shooting_mode0'], inputs['shooting_mode1'], inputs['shooting_mode2']]
+        mode = shooting_modes[0]                        # Default to 'auto'
+        cam0 = Picamera2(0)                             # Initialize cam0       
+        cam1 = Picamera2(1)                             # Initialize cam1
+        configs = build_configs(cam0, shooting_modes)   # Build and validate every shooting mode once
+        config = configs[mode]                          # Get the configuration for the cameras
+        configure_cameras(fname_log, mode)              # Configure the cameras
 
-standby = False
-tnow = time.time()
-monitor_gps()
-#######################################################################
-
-############################# Main loop ###############################
-# Hold right button ONLY for 3 seconds to enter standby mode    
-# Hold left button ONLY for 3 seconds to calibrate the cameras
-# Hold both buttons for 3 seconds to toggle modes, then:
-#                         - release both to toggle modes
-#                         - release left ONLY to exit script                              
-while True: 
-    if time.time() - tnow > 10 and not standby:
-        monitor_gps()
-    if right_button.is_held and not standby and not left_button.is_pressed:
-        standby = True
-        enter_standby(fdir, fname_log, dt, mode)    
-    if left_button.is_held and not standby and not right_button.is_pressed:
-        calib(fdir, fname_log, calib_dt, calib_frames, mode)
+        standby = False
+        tnow = time.time()
         monitor_gps()
-    if (right_button.is_held and left_button.is_held) and not standby:
-        [led.on() for led in (red, green, yellow)]
-        left_button.wait_for_release()
-        time.sleep(1)
-        if right_button.is_held:
-            break
-        else:
-            toggle_modes()
-            monitor_gps()
-    tnow = time.time()
-    time.sleep(0.2)
-#######################################################################
+        #######################################################################
+
+        ############################# Main loop ###############################
+        # Hold right button ONLY for 3 seconds to enter standby mode    
+        # Hold left button ONLY for 3 seconds to calibrate the cameras
+        # Hold both buttons for 3 seconds to toggle modes, then:
+        #                         - release both to toggle modes
+        #                         - release left ONLY to exit script                              
+        while True: 
+            if time.time() - tnow > 10 and not standby:
+                monitor_gps()
+            if right_button.is_held and not standby and not left_button.is_pressed:
+                standby = True
+                enter_standby(fdir, fname_log, dt, mode)    
+            if left_button.is_held and not standby and not right_button.is_pressed:
+                calib(fdir, fname_log, calib_dt, calib_frames, mode)
+                monitor_gps()
+            if (right_button.is_held and left_button.is_held) and not standby:
+                [led.on() for led in (red, green, yellow)]
+                left_button.wait_for_release()
+                time.sleep(1)
+                if right_button.is_held:
+                    break
+                else:
+                    toggle_modes()
+                    monitor_gps()
+            tnow = time.time()
+            time.sleep(0.2)
+        #######################################################################
 
-############################## Cleanup ###############################
-cam0.stop(), cam1.stop()                   # Stop the cameras
-cam0.close(), cam1.close()                 # Close the cameras
-green.close(), yellow.close(), red.close() # Close the LEDs
-right_button.close(), left_button.close()  # Close the buttons
-sys.exit(0)
-#######################################################################
\ No newline at end of file
+        ############################## Cleanup ###############################
+        cam0.stop(), cam1.stop()                   # Stop the cameras
+        cam0.close(), cam1.close()                 # Close the cameras
+        green.close(), yellow.close(), red.close() # Close the LEDs
+        right_button.close(), left_button.close()  # Close the buttons
+    finally:
+        vn_process.terminate(), vn_process.wait()  # Stop the VN-200 manager, also after a crash
+    sys.exit(0)
+    #######################################################################
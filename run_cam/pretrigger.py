@@ -0,0 +1,131 @@
+# Last updated: 2026-10-17
+##################################
+# Pre-trigger capture for standby. The CaptureEngine runs for the whole standby with a PreTrigger in place of its
+# FrameWriter. Until the trigger, every synchronized pair is copied into a RAM ring holding the last `seconds` of
+# pairs and nothing goes to disk. On trigger() the buffered pre-roll is handed to the FrameWriter (or encoded here
+# when there are no writer threads) under the names it was captured with, while live frames go straight to the writer
+# as usual. After release() the ring fills again; slots still waiting to be written are skipped until they are.
+# The ring is sized from the frame size, dt and the memory available at standby (pretrigger_mem of MemAvailable).
+# Image numbers do not restart per burst (ring slots are keyed by them); master.py widens them to 7 digits in file names.
+##################################
+import math
+import time
+import threading
+import numpy as np
+from writer import frame_shape, encode_jpeg
+from utils import mem_available_mb
+
+# Function to choose the number of pairs to keep: `seconds` of pairs at dt, limited to mem_frac of available memory
+def ring_pairs(config, seconds, dt, ncams=2, mem_frac=0.5, reserve_mb=200):
+    pair_bytes = ncams * int(np.prod(frame_shape(config)))
+    want = max(1, math.ceil(seconds / dt))
+    free = mem_available_mb()
+    if free is None:
+        return want
+    fit = int((free - reserve_mb) * mem_frac * 2 ** 20 // pair_bytes)
+    return max(1, min(want, fit))
+
+class PreTrigger:
+    def __init__(self, config, seconds, dt, writer=None, ncams=2, mem_frac=0.5):
+        self.fmt = config['main'].get('format', 'BGR888')
+        self.dt = dt
+        self.writer = writer                    # FrameWriter for pre-roll and live frames; None = save in the capture thread
+        self.npairs = ring_pairs(config, seconds, dt, ncams, mem_frac)
+        self.seconds = self.npairs * dt         # Pre-roll actually held
+        self.ring = np.empty((self.npairs, ncams) + frame_shape(config), dtype=np.uint8)
+        self.meta = [[None] * ncams for _ in range(self.npairs)]     # (image_num, fname, tnow) per slot and camera
+        self.pending = np.zeros(self.npairs, dtype=bool)            # Slot waiting to be written after a trigger
+        self.triggered = False
+        self.preroll = 0                        # Pairs handed over at the last trigger
+        self.live = 0                           # Live frames (all cameras) since the last trigger
+        self.skipped = 0                        # Frames not buffered because their slot was still pending
+        self._last_live = 0                     # Newest image number sent live
+        self._last_buffered = 0                 # Newest image number put in the ring
+        self._lock = threading.Lock()           # Guards the live/buffer decision, so both frames of a pair go the same way
+        self._flushers = []
+
+    @property
+    def dropped(self):
+        return self.writer.dropped if self.writer else [0] * self.ring.shape[1]
+
+    @property
+    def errors(self):
+        return self.writer.errors if self.writer else [0] * self.ring.shape[1]
+
+    def depth(self):
+        return self.writer.depth() if self.writer else 0
+
+    def write_request(self, idx, request, fname, tnow, image_num):
+        # CaptureEngine's FrameWriter interface. Returns False if the frame was dropped.
+        with self._lock:
+            # A frame goes the same way as its partner, if the partner was first
+            live = image_num > self._last_buffered if self.triggered else image_num <= self._last_live
+            if live:
+                self._last_live = max(self._last_live, image_num)
+            else:
+                self._last_buffered = max(self._last_buffered, image_num)
+        if live:
+            return self.write_live(idx, request, fname, tnow, image_num)
+        slot = (image_num - 1) % self.npairs
+        if self.pending[slot]:
+            self.skipped += 1
+        else:
+            np.copyto(self.ring[slot, idx], request.make_array('main').reshape(self.ring.shape[2:]))
+            self.meta[slot][idx] = (image_num, fname, tnow)
+        return True
+
+    def write_live(self, idx, request, fname, tnow, image_num):
+        self.live += 1
+        if self.writer is None:
+            request.save('main', fname)
+            return True
+        return self.writer.write_request(idx, request, fname, tnow, image_num)
+
+    def trigger(self):
+        # Write out the buffered pairs (oldest first) in the background and send live frames to the writer
+        with self._lock:
+            self.triggered = True
+            self.live = 0
+            newest = self._last_buffered
+        slot = (newest - 1) % self.npairs
+        tend = time.time() + 2 * self.dt + 0.5
+        while newest and time.time() < tend:   # Let the last buffered pair finish
+            if self.pending[slot] or all(m is not None and m[0] == newest for m in self.meta[slot]):
+                break
+            time.sleep(0.001)
+        jobs = []
+        for slot, meta in enumerate(self.meta):
+            nums = {m[0] if m is not None else None for m in meta}
+            if not self.pending[slot] and len(nums) == 1 and None not in nums:     # Complete pairs only
+                jobs.append((nums.pop(), slot, [(idx, *m) for idx, m in enumerate(meta)]))
+        jobs.sort()
+        self.pending[[slot for _, slot, _ in jobs]] = True
+        self.preroll = len(jobs)
+        flusher = threading.Thread(target=self._flush, args=[jobs], daemon=True)
+        flusher.start()
+        self._flushers = [t for t in self._flushers if t.is_alive()] + [flusher]
+
+    def release(self):
+        # Back to buffering; the ring only holds frames captured after this
+        with self._lock:
+            self.meta = [[None] * self.ring.shape[1] for _ in range(self.npairs)]
+            self.triggered = False
+
+    def _flush(self, jobs):
+        for _, slot, frames in jobs:
+            for idx, image_num, fname, tnow in frames:
+                if self.writer is None:
+                    encode_jpeg(self.ring[slot, idx], self.fmt, fname)
+                else:
+                    while self.writer.depth() > len(self.writer.ring) // 2:     # Leave room for live frames
+                        time.sleep(0.01)
+                    self.writer.write_frame(idx, self.ring[slot, idx], fname, tnow, image_num)
+            self.pending[slot] = False
+
+    def join(self):
+        # Block until every pre-roll has been handed over
+        [t.join() for t in self._flushers]
+        self._flushers = []
+
+    def close(self):
+        self.join()
@@ -0,0 +1,186 @@
+# Last updated: 2026-10-17
+##################################
+# Quick-look reconstruction during standby, so a session can be checked on the Pi before it is copied off.
+# The FrameWriter reports every frame it has written (on_written); every Nth pair's names are passed to a separate
+# process, which decodes the pair downsampled, remaps it with rectification tables cached next to the calibration
+# (calib_cv.npz from calibrate.py or export_calib_cv.m), runs a cheap block matcher and appends the valid-pixel
+# fraction and median range to <session>/quicklook.csv. Nothing scans the session directories.
+# The process runs at idle priority (SCHED_IDLE, nice 19) with one OpenCV thread and its own GIL, so it never holds up
+# the capture threads, and keeps to a CPU duty-cycle budget. A thread here checks every poll_dt and pauses it while
+# free memory is low or the writer queue is deep; the pause doubles (up to 30 s) while frames or slots keep being lost.
+##################################
+import os
+import time
+import queue
+import hashlib
+import threading
+import multiprocessing as mp
+import numpy as np
+from eventlog import get_log
+from utils import mem_available_mb
+
+calib_keys = ('K1', 'D1', 'K2', 'D2', 'R', 'T')
+csv_header = 'image_num,name0,name1,t_proc,valid_frac,median_disp,median_range_m'
+reduced_flags = {1: 0, 2: 16, 4: 32, 8: 64}   # cv2.IMREAD_(REDUCED_)GRAYSCALE_<n>
+
+# Function to get downsampled rectification maps and Q for a calibration, computing and caching them if needed
+def quicklook_maps(fname_calib, downsample):
+    import cv2
+    m = np.load(fname_calib)
+    calib = {k: np.asarray(m[k], dtype=np.float64) for k in calib_keys}
+    rows, cols = (int(v) for v in np.ravel(m['imageSize']))
+    h = hashlib.sha1()
+    [h.update(calib[k].tobytes()) for k in calib_keys]
+    size = (cols // downsample, rows // downsample)
+    fname = os.path.join(os.path.dirname(os.path.abspath(fname_calib)), f"quicklook_maps_{h.hexdigest()[:12]}_{size[0]}x{size[1]}.npz")
+    if not os.path.exists(fname):
+        S = np.array([[1 / downsample, 0, 0.5 / downsample - 0.5], [0, 1 / downsample, 0.5 / downsample - 0.5], [0, 0, 1]])
+        K1, K2 = S @ calib['K1'], S @ calib['K2']
+        D1, D2, T = calib['D1'].ravel(), calib['D2'].ravel(), calib['T'].reshape(3, 1)
+        R1, R2, P1, P2, Q, roi1, roi2 = cv2.stereoRectify(K1, D1, K2, D2, size, calib['R'], T, flags=cv2.CALIB_ZERO_DISPARITY, alpha=0)
+        m1x, m1y = cv2.initUndistortRectifyMap(K1, D1, R1, P1, size, cv2.CV_16SC2)
+        m2x, m2y = cv2.initUndistortRectifyMap(K2, D2, R2, P2, size, cv2.CV_16SC2)
+        with open(fname + '.tmp', 'wb') as f:
+            np.savez(f, m1x=m1x, m1y=m1y, m2x=m2x, m2y=m2y, Q=Q)
+        os.replace(fname + '.tmp', fname)
+    return dict(np.load(fname))
+
+def _lower_priority():
+    try:
+        os.sched_setscheduler(0, os.SCHED_IDLE, os.sched_param(0))     # Only runs on otherwise idle cores
+    except (AttributeError, OSError):
+        pass
+    try:
+        os.setpriority(os.PRIO_PROCESS, 0, 19)
+    except (AttributeError, OSError):
+        pass
+
+# Quick-look process: reads (idx, fname, image_num, t_us) of written frames from jobs until None, and processes the
+# newest complete pair whenever paused is clear
+def _run(jobs, paused, fname_csv, fname_calib, fname_log, downsample, cpu_budget, poll_dt):
+    _lower_priority()                           # Before OpenCV starts any threads
+    try:
+        import cv2
+        cv2.setNumThreads(1)
+        maps = quicklook_maps(fname_calib, downsample)
+    except Exception as e:
+        get_log(fname_log).event(f"Quick look disabled: {e}")
+        while jobs.get() is not None:           # Keep draining so the pipe never fills
+            pass
+        return
+    nd = max(16, -(-64 // downsample // 16) * 16)
+    matcher = cv2.StereoBM_create(numDisparities=nd, blockSize=9)
+    flag = reduced_flags[downsample]
+    f = open(fname_csv, 'a')
+    if f.tell() == 0:
+        f.write(csv_header + '\n')
+    frames = [{}, {}]                           # Written frames per camera not yet looked at: image_num -> (fname, t_us)
+    results, closing = [], False
+    while not closing:
+        try:
+            job = jobs.get(timeout=poll_dt)
+        except queue.Empty:
+            job = ()
+        while job:                              # Take everything queued; only the newest pair is processed
+            idx, fname, image_num, t_us = job
+            frames[idx][image_num] = (fname, t_us)
+            try:
+                job = jobs.get_nowait()
+            except queue.Empty:
+                job = ()
+        closing = job is None
+        for cam in frames:                      # Older frames are never looked at
+            [cam.pop(n) for n in sorted(cam, key=lambda n: cam[n][1])[:-8]]
+        pairs = [n for n in frames[1] if n in frames[0] and abs(frames[0][n][1] - frames[1][n][1]) <= 250000]
+        if not pairs or paused.is_set():
+            continue
+        image_num = max(pairs, key=lambda n: frames[1][n][1])
+        (name0, _), (name1, _) = frames[0][image_num], frames[1][image_num]
+        frames = [{}, {}]
+        t0 = time.time()
+        left = cv2.imread(name1, flag)          # cam1 is left, as in B_Rectify.m
+        right = cv2.imread(name0, flag)
+        if left is None or right is None:
+            continue
+        J1 = cv2.remap(left, maps['m1x'], maps['m1y'], cv2.INTER_LINEAR)
+        J2 = cv2.remap(right, maps['m2x'], maps['m2y'], cv2.INTER_LINEAR)
+        disp = matcher.compute(J1, J2).astype(np.float32) / 16
+        valid = disp > 0
+        d = float(np.median(disp[valid])) if valid.any() else np.nan
+        z = abs(maps['Q'][2, 3] / (maps['Q'][3, 2] * d)) / 1000 if valid.any() else np.nan     # mm -> m
+        busy = time.time() - t0
+        f.write(f"{image_num},{os.path.basename(name0)},{os.path.basename(name1)},{busy:.3f},{valid.mean():.4f},{d:.2f},{z:.2f}\n"), f.flush()
+        results.append((valid.mean(), z))
+        if not closing:
+            time.sleep(busy * (1 / cpu_budget - 1))     # Duty cycle; frames written meanwhile wait in the pipe
+    f.close()
+    if results:
+        valid, z = np.array(results).T
+        get_log(fname_log).event(f"Quick look: {len(results)} pairs, valid fraction median {np.median(valid):.2f}, "
+                                 f"range median {np.nanmedian(z):.2f} m")
+
+class QuickLook:
+    # Runs the quick-look process, passes it every Nth pair from FrameWriter.on_written and pauses it while capture is behind
+    def __init__(self, fdir_out, fname_calib, fname_log, writer, engine=None, every=10, downsample=4,
+                 cpu_budget=0.25, min_free_mb=150, max_depth=4, poll_dt=1.0):
+        self.fname_log = fname_log
+        self.writer = writer                    # FrameWriter to take frames from and watch for back-pressure
+        self.engine = engine                    # CaptureEngine to watch for missed slots
+        self.every = every                      # Process pairs whose image number is a multiple of this
+        self.min_free_mb = min_free_mb          # Pause while less memory than this is available
+        self.max_depth = max_depth              # ... or while the writer queue is deeper than this
+        self.poll_dt = poll_dt
+        self.throttled = 0                      # Checks that paused the quick look because capture or writing was behind
+        self._pressure = (0, 0)                 # Writer drops and missed slots at the last check
+        ctx = mp.get_context('spawn')           # A fresh interpreter, not a fork of the camera process
+        self._jobs = ctx.Queue()                # put() hands off to a feeder thread, so it never blocks the writer
+        self._paused = ctx.Event()
+        self._process = ctx.Process(target=_run, args=(self._jobs, self._paused, fdir_out + 'quicklook.csv', fname_calib,
+                                                       fname_log, downsample, cpu_budget, poll_dt), daemon=True)
+        self._process.start()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._watch, daemon=True)
+        self._thread.start()
+        writer.on_written = self.written
+
+    def written(self, idx, fname, image_num, t_us):
+        # Called by the writer threads, so only a filter and a hand-off
+        if image_num % self.every == 0:
+            self._jobs.put((idx, fname, image_num, t_us))
+
+    def behind(self):
+        # (frames or slots lost since the last check, writer queue deep or memory low)
+        dropped = sum(self.writer.dropped)
+        missed = self.engine.missed if self.engine else 0
+        lost = dropped > self._pressure[0] or missed > self._pressure[1]
+        self._pressure = (dropped, missed)
+        free = mem_available_mb()
+        return lost, self.writer.depth() > self.max_depth or (free is not None and free < self.min_free_mb)
+
+    def _watch(self):
+        # Pause while behind; the pause doubles (up to 30 s) while frames or slots keep being lost
+        backoff, resume = self.poll_dt, 0
+        while not self._stop.wait(self.poll_dt):
+            lost, busy = self.behind()
+            if lost:
+                resume, backoff = time.time() + backoff, min(backoff * 2, 30)
+            elif not busy and time.time() >= resume:
+                backoff = self.poll_dt
+            if lost or busy or time.time() < resume:
+                self.throttled += 1
+                self._paused.set()
+            else:
+                self._paused.clear()
+
+    def log(self, msg):
+        get_log(self.fname_log).event(msg)
+
+    def close(self):
+        self.writer.on_written = None
+        self._stop.set()
+        self._thread.join()
+        self._jobs.put(None)
+        self._process.join()
+        self._jobs.close()
+        if self.throttled:
+            self.log(f"Quick look: paused {self.throttled} times while capture or writing was behind")
@@ -0,0 +1,151 @@
+# Last updated: 2026-10-17
+##################################
+# Append-only session container: one preallocated .stk file per camera instead of thousands of small JPEGs.
+# Layout:   [header (4096 B)] [frame index (capacity x 40 B)] [payloads, raw frames or JPEG bytes, appended]
+# A frame's payload and index entry are written before the frame count in the header is bumped, so a reader
+# (or a power cut) only ever sees complete frames.
+# Usage (export to the cam0/cam1 JPEG layout used by the MATLAB scripts):
+#   python sessionfile.py <session_dir>
+##################################
+import os
+import sys
+import struct
+import threading
+import numpy as np
+from datetime import datetime, timezone
+
+magic = b'STOKESTK'
+version = 1
+header_bytes = 4096
+header_fmt = '<8sIIQQQQ16s'         # magic, version, camera, capacity, count, index offset, data offset, pixel format
+count_offset = 24                   # Byte offset of count in the header
+chunk_bytes = 1 << 30               # Payload space is preallocated in 1 GiB steps
+RAW, JPEG = 0, 1
+index_dtype = np.dtype([('image_num', '<u4'), ('encoding', 'u1'), ('channels', 'u1'), ('height', '<u2'),
+                        ('width', '<u2'), ('pad', 'V6'), ('t_us', '<i8'), ('offset', '<u8'), ('nbytes', '<u8')])
+
+class SessionFile:
+    def __init__(self, fname, camera, fmt='BGR888', capacity=200000):
+        self.fname = fname
+        self.camera = camera
+        self.fmt = fmt
+        self.capacity = capacity
+        self.count = 0
+        self.index_offset = header_bytes
+        self.data_offset = header_bytes + capacity * index_dtype.itemsize
+        self._end = self.data_offset            # Next free payload byte
+        self._allocated = 0
+        self._lock = threading.Lock()
+        self._fd = os.open(fname, os.O_RDWR | os.O_CREAT | os.O_EXCL, 0o644)
+        header = struct.pack(header_fmt, magic, version, camera, capacity, 0, self.index_offset, self.data_offset,
+                             fmt.encode())
+        os.pwrite(self._fd, header.ljust(header_bytes, b'\0'), 0)
+        self._reserve(self.data_offset + chunk_bytes)
+
+    def _reserve(self, nbytes):
+        # Grow the file in whole chunks so the SD card sees few, large allocations
+        size = -(-nbytes // chunk_bytes) * chunk_bytes
+        if size <= self._allocated:
+            return
+        if hasattr(os, 'posix_fallocate'):
+            os.posix_fallocate(self._fd, 0, size)
+        else:
+            os.ftruncate(self._fd, size)
+        self._allocated = size
+
+    def append(self, image_num, t_us, payload, encoding=RAW, shape=(0, 0, 0)):
+        # payload: numpy frame (RAW) or JPEG bytes. Returns False if the index is full.
+        data = memoryview(np.ascontiguousarray(payload)).cast('B') if encoding == RAW else memoryview(payload)
+        h, w, c = shape if encoding == JPEG else payload.shape
+        with self._lock:
+            if self.count >= self.capacity:
+                return False
+            offset = self._end
+            self._reserve(offset + len(data))
+            os.pwrite(self._fd, data, offset)
+            entry = np.zeros(1, dtype=index_dtype)
+            entry[0] = (image_num, encoding, c, h, w, b'', t_us, offset, len(data))
+            os.pwrite(self._fd, entry.tobytes(), self.index_offset + self.count * index_dtype.itemsize)
+            self.count += 1
+            self._end = offset + len(data)
+            os.pwrite(self._fd, struct.pack('<Q', self.count), count_offset)
+        return True
+
+    def close(self):
+        os.ftruncate(self._fd, self._end)       # Give back the unused preallocation
+        os.fsync(self._fd)
+        os.close(self._fd)
+
+class SessionReader:
+    def __init__(self, fname):
+        self.fname = fname
+        self.mm = np.memmap(fname, dtype=np.uint8, mode='r')
+        (mg, ver, self.camera, self.capacity, count, index_offset, data_offset,
+         fmt) = struct.unpack_from(header_fmt, self.mm, 0)
+        if mg != magic:
+            raise ValueError(f"Not a session file: {fname}")
+        self.fmt = fmt.rstrip(b'\0').decode()
+        self.index = self.mm[index_offset:index_offset + count * index_dtype.itemsize].view(index_dtype)
+        self._order = np.lexsort((self.index['t_us'], self.index['image_num']))     # By image number, then time
+        self._nums = self.index['image_num'][self._order]
+
+    def __len__(self):
+        return len(self.index)
+
+    def frame(self, k):
+        # k-th frame in write order: a zero-copy (h, w, c) view for RAW, the JPEG bytes view for JPEG
+        e = self.index[k]
+        data = self.mm[e['offset']:e['offset'] + e['nbytes']]
+        if e['encoding'] == RAW:
+            return data.reshape(e['height'], e['width'], e['channels'])
+        return data
+
+    def find_all(self, image_num):
+        # Positions (write order) of every frame numbered image_num, oldest first. A container covers a whole standby
+        # session and image numbers restart at 1 every burst, so a number alone can match one frame per burst.
+        lo, hi = np.searchsorted(self._nums, image_num), np.searchsorted(self._nums, image_num, side='right')
+        return self._order[lo:hi].astype(int).tolist()
+
+    def find(self, image_num, t_us, tol_us=250000):
+        # Position of the frame keyed by (image_num, host time t_us): the match nearest in time within tol_us, or -1
+        ks = self.find_all(image_num)
+        if not ks:
+            return -1
+        dt = np.abs(self.index['t_us'][ks].astype(np.int64) - int(t_us))
+        return ks[int(np.argmin(dt))] if dt.min() <= tol_us else -1
+
+    def by_image_num(self, image_num, t_us, tol_us=250000):
+        k = self.find(image_num, t_us, tol_us)
+        if k < 0:
+            raise KeyError((image_num, t_us))
+        return self.frame(k)
+
+    def filename(self, k):
+        # The name the frame would have had as a JPEG: <cam>_HHMMSSffffff_NNNNN.jpg
+        e = self.index[k]
+        tstr = datetime.fromtimestamp(e['t_us'] / 1e6, timezone.utc).strftime('%H%M%S%f')
+        return f"{self.camera}_{tstr}_{e['image_num']:05}.jpg"
+
+def export_jpegs(fname_stk, fdir_cam, quality=90):
+    from writer import encode_jpeg      # writer imports this module
+    reader = SessionReader(fname_stk)
+    os.makedirs(fdir_cam, exist_ok=True)
+    for k in range(len(reader)):
+        fname = os.path.join(fdir_cam, reader.filename(k))
+        frame = reader.frame(k)
+        if reader.index[k]['encoding'] == JPEG:
+            with open(fname, 'wb') as f:
+                f.write(frame.tobytes())
+        else:
+            encode_jpeg(frame, reader.fmt, fname, quality)
+    return len(reader)
+
+def export_session(fdir_out):
+    for cam in (0, 1):
+        fname_stk = os.path.join(fdir_out, f"cam{cam}.stk")
+        if os.path.exists(fname_stk):
+            n = export_jpegs(fname_stk, os.path.join(fdir_out, f"cam{cam}"))
+            print(f"{fname_stk}: exported {n} frames")
+
+if __name__ == '__main__':
+    export_session(sys.argv[1])
@@ -1,80 +1,93 @@
-# Last updated: 2024-10-03
+# Last updated: 2026-10-17
 ##################################
-# This file contains functions defining the camera settings for various shooting modes
+# This file contains functions defining the camera settings for various shooting modes.
+# build_configs prebuilds every shooting mode once at startup from an open camera, and switch_mode moves the open
+# cameras between modes: controls only when the streams are the same, stop/configure/start otherwise.
 ##################################
-from picamera2 import Picamera2
-from libcamera import ColorSpace, Transform
+import time
+from backends import Picamera2
 
-def auto():
-    cam = Picamera2()
+def auto(cam):
     config = cam.create_still_configuration()
     config['main']['size'] = (1440, 1080)
     config['controls']['FrameDurationLimits'] = (500, 500)  
-    cam.close()
     return config
 
-def fast():
-    cam = Picamera2()
+def fast(cam):
     config = cam.create_still_configuration()
     config['main']['size'] = (1440, 1080)
     config['main']['format'] = 'RGB888'
     config['controls']['FrameDurationLimits'] = (500, 500)  
     config['controls']['ExposureTime'] = 1000
-    cam.close()
     return config
 
-def max():
-    cam = Picamera2()
+def max(cam):
     config = cam.create_still_configuration()
     config['main']['size'] = (1440, 1080)
     config['main']['format'] = 'RGB888'
     config['controls']['FrameDurationLimits'] = (200, 200)  
     config['controls']['ExposureTime'] = 100
-    cam.close()
     return config
 
-def standard():
-    cam = Picamera2()
+def standard(cam):
     config = cam.create_still_configuration()
     config['main']['size'] = (1440, 1080)
     config['main']['format'] = 'RGB888'
     config['controls']['FrameDurationLimits'] = (33333, 33333)  
     config['controls']['ExposureTime'] = 5000 
-    cam.close()
     return config
 
-def bright():
-    cam = Picamera2()
+def bright(cam):
     config = cam.create_still_configuration()
     config['main']['size'] = (1440, 1080)
     config['main']['format'] = 'RGB888'
     config['controls']['FrameDurationLimits'] = (33333, 33333)  
     config['controls']['ExposureTime'] = 2000
-    cam.close()
     return config
 
-def dark():
-    cam = Picamera2()
+def dark(cam):
     config = cam.create_still_configuration()
     config['main']['size'] = (1440, 1080)
     config['main']['format'] = 'RGB888'
     config['controls']['FrameDurationLimits'] = (33333, 33333)  
     config['controls']['ExposureTime'] = 100000 
+    return config
+
+modes = {'auto': auto, 'fast': fast, 'max': max, 'standard': standard, 'bright': bright, 'dark': dark}
+
+def get_config(mode, cam=None):
+    if mode not in modes:
+        raise ValueError(f"Invalid mode: {mode}")
+    if cam is not None:
+        return modes[mode](cam)
+    cam = Picamera2()
+    config = modes[mode](cam)
     cam.close()
     return config
 
-def get_config(mode):
-    if mode == 'auto':
-        return auto()
-    elif mode == 'fast':
-        return fast()
-    elif mode == 'max':
-        return max()
-    elif mode == 'standard':
-        return standard()
-    elif mode == 'bright':
-        return bright()
-    elif mode == 'dark':
-        return dark()
+# Function to build and validate the configuration of every shooting mode once, on an open (stopped) camera.
+# Each config is applied to the camera, so an invalid mode fails at startup instead of in the field.
+def build_configs(cam, shooting_modes):
+    configs = {}
+    for mode in shooting_modes:
+        config = get_config(mode, cam)
+        config['controls']['AeEnable'] = 'ExposureTime' not in config['controls']  # Fixed exposure modes turn AE off
+        cam.configure(config)
+        configs[mode] = config
+    return configs
+
+# Function to check whether going from config a to config b needs the cameras reconfigured (streams differ)
+# or only new controls
+def needs_configure(a, b):
+    return {k: v for k, v in a.items() if k != 'controls'} != {k: v for k, v in b.items() if k != 'controls'}
+
+# Function to switch open, started cameras from config a to config b. Returns the latency in seconds.
+def switch_mode(cams, a, b):
+    t0 = time.time()
+    if needs_configure(a, b):
+        [cam.stop() for cam in cams]
+        [cam.configure(b) for cam in cams]
+        [cam.start() for cam in cams]
     else:
-        raise ValueError(f"Invalid mode: {mode}")
\ No newline at end of file
+        [cam.set_controls(b['controls']) for cam in cams]
+    return time.time() - t0
@@ -0,0 +1,284 @@
+# Last updated: 2026-10-17
+##################################
+# Simulated hardware for running the acquisition code off the Pi.
+# SimPicamera2 mimics the parts of the Picamera2 API used by run_cam: a free-running sensor that delivers a new
+# frame every frame_dt seconds, with a configurable encode/write latency on save.
+# SimEzAsyncData replays VN-200 packets, and SimButton/SimLED stand in for gpiozero, with the buttons driven by a
+# ButtonScript of timed presses. backends.py picks these when STOKE_SIM=1.
+##################################
+import time
+import threading
+import numpy as np
+
+class SimRequest:
+    def __init__(self, cam, sensor_ns, frame):
+        self.cam = cam
+        self.sensor_ns = sensor_ns
+        self.frame = frame
+
+    def get_metadata(self):
+        return {'SensorTimestamp': self.sensor_ns, 'ExposureTime': self.cam.controls.get('ExposureTime', 0)}
+
+    def make_array(self, name='main'):
+        return self.frame
+
+    def save(self, name, fname):
+        time.sleep(self.cam.encode_dt)          # JPEG encode + SD write
+        with open(fname, 'wb') as f:
+            f.write(self.frame.tobytes()[:self.cam.jpeg_bytes])
+
+    def release(self):
+        pass
+
+class SimPicamera2:
+    def __init__(self, camera_num=0, frame_dt=1/60, encode_dt=0.03, jpeg_bytes=300000, size=(1440, 1080)):
+        self.camera_num = camera_num
+        self.frame_dt = frame_dt                # Fastest frame period the sensor can deliver (s)
+        self.encode_dt = encode_dt              # Time spent in save() (s)
+        self.jpeg_bytes = jpeg_bytes            # Bytes written per saved frame
+        self.size = size
+        self.format = 'RGB888'
+        self.controls = {}
+        self.config = None
+        self.started = False
+        self._phase = camera_num * 0.37 * frame_dt   # Cameras are not hardware-synced
+        self._lock = threading.Lock()
+        self._frame = None
+
+    def create_still_configuration(self):
+        return {'use_case': 'still', 'main': {'size': self.size, 'format': 'BGR888'}, 'controls': {}}
+
+    def configure(self, config):
+        self.config = config
+        self.size = tuple(config['main']['size'])
+        self.format = config['main'].get('format', 'BGR888')
+        self.controls = dict(config.get('controls', {}))
+        self._frame = None
+
+    def camera_configuration(self):
+        return self.config
+
+    def set_controls(self, controls):
+        self.controls.update(controls)
+
+    def start(self):
+        self.started = True
+
+    def stop(self):
+        self.started = False
+
+    def close(self):
+        self.started = False
+
+    def _period(self):
+        limits = self.controls.get('FrameDurationLimits')
+        return max(self.frame_dt, limits[0] / 1e6) if limits else self.frame_dt
+
+    def _next_frame(self):
+        # Block until the next sensor frame boundary and return its timestamp (ns, monotonic clock)
+        period = self._period()
+        tnow = time.monotonic()
+        tframe = (int((tnow - self._phase) / period) + 1) * period + self._phase
+        time.sleep(tframe - tnow)
+        return int(tframe * 1e9)
+
+    def _array(self):
+        with self._lock:
+            if self._frame is None:
+                w, h = self.size
+                c = 4 if self.format.startswith('X') else 3
+                self._frame = np.random.default_rng(self.camera_num).integers(0, 255, (h, w, c), dtype=np.uint8)
+            return self._frame
+
+    def capture_request(self):
+        return SimRequest(self, self._next_frame(), self._array())
+
+    def capture_metadata(self):
+        return {'SensorTimestamp': self._next_frame(), 'ExposureTime': self.controls.get('ExposureTime', 0)}
+
+    def capture_array(self, name='main'):
+        self._next_frame()
+        return self._array().copy()
+
+    def capture_file(self, fname):
+        request = self.capture_request()
+        request.save('main', fname)
+        request.release()
+
+class SimVec3:
+    def __init__(self, x, y, z):
+        self.x, self.y, self.z = x, y, z
+
+class SimTimeUtc:
+    def __init__(self, row):
+        self.year, self.month, self.day = int(row['year']), int(row['month']), int(row['day'])
+        self.hour, self.minute, self.second, self.ms = int(row['hour']), int(row['minute']), int(row['second']), int(row['ms'])
+
+    def __str__(self):
+        return f"20{self.year:02}-{self.month:02}-{self.day:02}T{self.hour:02}:{self.minute:02}:{self.second:02}.{self.ms:03}"
+
+class SimCompositeData:
+    # One VN-200 packet built from an imulog.imu_dtype record
+    def __init__(self, row):
+        self.time_utc = SimTimeUtc(row)
+        self.yaw_pitch_roll = SimVec3(*row['ypr'].tolist())
+        self.acceleration_uncompensated = SimVec3(*row['accel'].tolist())
+        self.angular_rate_uncompensated = SimVec3(*row['gyro'].tolist())
+        self.magnetic_uncompensated = SimVec3(*row['mag'].tolist())
+        self.position_gps_lla = SimVec3(*row['lla'].tolist())
+        self.position_estimated_lla = self.position_gps_lla
+        self.any_position_uncertainty = SimVec3(2.0, 2.0, 3.0)
+        self.position_uncertainty_estimated = 2.5
+        self.num_sats = 12
+        self.temperature, self.pressure = 20.0, 101.3
+        for attr in ('time_utc', 'time_gps', 'yaw_pitch_roll', 'acceleration_uncompensated', 'angular_rate_uncompensated',
+                     'magnetic_uncompensated', 'position_gps_lla', 'any_position', 'num_sats'):
+            setattr(self, 'has_' + attr, True)
+
+def sim_imu_records(n=1000, rate=100):
+    # Synthetic packets: a slow swell-like roll/pitch and a fixed position off Scripps pier
+    from imulog import imu_dtype
+    rec = np.zeros(n, dtype=imu_dtype)
+    t = np.arange(n) / rate
+    tnow = time.time()
+    for k, tk in enumerate(t):
+        ts = time.gmtime(tnow + tk)
+        rec[k]['year'], rec[k]['month'], rec[k]['day'] = ts.tm_year - 2000, ts.tm_mon, ts.tm_mday
+        rec[k]['hour'], rec[k]['minute'], rec[k]['second'] = ts.tm_hour, ts.tm_min, ts.tm_sec
+        rec[k]['ms'] = int((tnow + tk) * 1000) % 1000
+    rec['ypr'] = np.stack([90 + 0 * t, 3 * np.sin(2 * np.pi * t / 10), 5 * np.sin(2 * np.pi * t / 8)], axis=1)
+    rec['accel'] = (0.0, 0.0, -9.81)
+    rec['gyro'] = (0.0, 0.0, 0.0)
+    rec['mag'] = (0.2, 0.0, 0.4)
+    rec['lla'] = (32.8665, -117.2571, 10.0)
+    return rec
+
+class SimVnSensor:
+    def __init__(self, ez):
+        self.ez = ez
+        self.binary_output_1 = None
+
+    def read_model_number(self):
+        return 'VN-200 (sim)'
+
+    def read_serial_number(self):
+        return 0
+
+    def write_binary_output_1(self, bor):
+        self.binary_output_1 = bor
+
+    def read_yaw_pitch_roll(self):
+        return self.ez.current_data.yaw_pitch_roll
+
+    def read_gps_solution_lla(self):
+        gps = SimVec3(0, 0, 0)
+        gps.lla = self.ez.current_data.position_gps_lla
+        return gps
+
+    def read_imu_measurements(self):
+        cd = self.ez.current_data
+        imu = SimVec3(0, 0, 0)
+        imu.accel, imu.gyro, imu.mag = cd.acceleration_uncompensated, cd.angular_rate_uncompensated, cd.magnetic_uncompensated
+        imu.temp, imu.pressure = cd.temperature, cd.pressure
+        return imu
+
+    def disconnect(self):
+        self.ez.running = False
+
+class SimEzAsyncData:
+    # Stand-in for vnpy.EzAsyncData that replays recorded packets (imulog.imu_dtype records, e.g. from
+    # imulog.read_bin) at a fixed rate, looping at the end of the recording
+    def __init__(self, records=None, rate=100):
+        self.records = sim_imu_records(rate=rate) if records is None else records
+        self.rate = rate
+        self.running = True
+        self.sensor = SimVnSensor(self)
+        self._k = 0
+        self._tnext = time.monotonic()
+        self.current_data = SimCompositeData(self.records[0])
+
+    @classmethod
+    def connect(cls, port='/dev/ttyUSB0', baud=115200, records=None, rate=100):
+        return cls(records, rate)
+
+    def next_data(self, timeout_ms=None):
+        tsleep = self._tnext - time.monotonic()
+        if timeout_ms is not None and tsleep > timeout_ms / 1000:
+            time.sleep(timeout_ms / 1000)
+            return None
+        if tsleep > 0:
+            time.sleep(tsleep)
+        self._tnext += 1 / self.rate
+        self.current_data = SimCompositeData(self.records[self._k % len(self.records)])
+        self._k += 1
+        return self.current_data
+
+class SimLED:
+    def __init__(self, pin):
+        self.pin = pin
+        self.state = 'off'
+
+    def on(self):
+        self.state = 'on'
+
+    def off(self):
+        self.state = 'off'
+
+    def blink(self, on_time=1, off_time=1):
+        self.state = 'blink'
+
+    def close(self):
+        self.state = 'off'
+
+class ButtonScript:
+    # Timed button presses: steps of (duration s, pins held), played from the first time a button is looked at.
+    # After the last step no button is pressed.
+    def __init__(self, steps):
+        self.steps = steps
+        self._t0 = None
+
+    def _elapsed(self):
+        if self._t0 is None:
+            self._t0 = time.monotonic()
+        return time.monotonic() - self._t0
+
+    def held(self, pin):
+        # Seconds pin has been held continuously, or None if it is not pressed now
+        t, tstart, since = self._elapsed(), 0.0, None
+        for duration, pins in self.steps:
+            since = (tstart if since is None else since) if pin in pins else None
+            if t < tstart + duration:
+                return None if since is None else t - since
+            tstart += duration
+        return None
+
+# Default script for master.py: idle, enter standby (hold right), one 2 s burst, exit standby (hold both),
+# then quit (hold both, release left first)
+default_script = [(2, ()), (3.5, (18,)), (2, ()), (2, (18,)), (2, ()), (3.5, (17, 18)), (3, ()), (3.5, (17, 18)), (2, (18,)), (5, ())]
+
+class SimButton:
+    script = None                           # ButtonScript shared by all buttons
+
+    def __init__(self, pin, hold_time=1):
+        self.pin = pin
+        self.hold_time = hold_time
+        if SimButton.script is None:
+            SimButton.script = ButtonScript(default_script)
+
+    @property
+    def is_pressed(self):
+        return self.script.held(self.pin) is not None
+
+    @property
+    def is_held(self):
+        held = self.script.held(self.pin)
+        return held is not None and held >= self.hold_time
+
+    def wait_for_release(self, timeout=None):
+        t0 = time.monotonic()
+        while self.is_pressed and (timeout is None or time.monotonic() - t0 < timeout):
+            time.sleep(0.01)
+        return not self.is_pressed
+
+    def close(self):
+        pass
@@ -0,0 +1,110 @@
+# Last updated: 2026-10-17
+##################################
+# Per-frame capture telemetry. CaptureEngine and FrameWriter record one fixed-size event per camera per frame into
+# memory; the events are appended to <session>/telemetry.bin after each burst (flush), as raw records of `dtype`:
+#   kind 0 capture: t_sched, t_host (before capture_request), sensor_ns, d1 = capture_request s,
+#                   d2 = handoff s (save in the capture thread, or copy into the writer ring), depth = writer queue
+#                   depth after submit, flags: 1 = dropped because the ring was full, 2 = capture/save raised
+#   kind 1 written: t_host of the frame it belongs to, t_sched = time written, d1 = s waiting in the writer queue,
+#                   d2 = encode + write s, depth = queue depth when taken
+#   kind 2 missed:  t_sched of the first skipped slot, flags = number of slots skipped
+# Usage (summary of a session's telemetry):
+#   python telemetry.py <session_dir or telemetry.bin> [dt]
+##################################
+import os
+import sys
+import threading
+import numpy as np
+
+dtype = np.dtype([('kind', 'u1'), ('cam', 'u1'), ('flags', '<u2'), ('image_num', '<u4'), ('t_sched', '<f8'),
+                  ('t_host', '<f8'), ('sensor_ns', '<i8'), ('d1', '<f4'), ('d2', '<f4'), ('depth', '<u2'), ('pad', '<u2')])
+CAPTURE, WRITTEN, MISSED = 0, 1, 2
+
+class Telemetry:
+    def __init__(self, fname):
+        self.fname = fname
+        self._rows = []
+        self._lock = threading.Lock()
+
+    def _add(self, row):
+        with self._lock:
+            self._rows.append(row)
+
+    def capture(self, cam, image_num, t_sched, t_host, sensor_ns, capture_s, handoff_s, depth, flags):
+        self._add((CAPTURE, cam, flags, image_num, t_sched, t_host, sensor_ns, capture_s, handoff_s, depth, 0))
+
+    def written(self, cam, image_num, t_host, t_written, wait_s, write_s, depth):
+        self._add((WRITTEN, cam, 0, image_num, t_written, t_host, 0, wait_s, write_s, depth, 0))
+
+    def missed(self, nslots, t_sched):
+        self._add((MISSED, 0, nslots, 0, t_sched, 0.0, 0, 0.0, 0.0, 0, 0))
+
+    def flush(self):
+        with self._lock:
+            rows, self._rows = self._rows, []
+        if rows:
+            with open(self.fname, 'ab') as f:
+                f.write(np.array(rows, dtype=dtype).tobytes())
+
+    def close(self):
+        self.flush()
+
+def load(fname):
+    if os.path.isdir(fname):
+        fname = os.path.join(fname, 'telemetry.bin')
+    return np.fromfile(fname, dtype=dtype)
+
+def percentiles(x, p=(50, 90, 99, 100)):
+    return ', '.join(f"p{q} {v:.3f}" for q, v in zip(p, np.percentile(x, p))) if len(x) else 'n/a'
+
+def histogram(x, edges):
+    counts, _ = np.histogram(np.clip(x, edges[0], edges[-1]), edges)
+    width = 40 / max(counts.max(), 1)
+    return '\n'.join(f"    {a:8.1f} - {b:8.1f} ms {c:7d} {'#' * int(np.ceil(c * width))}" for a, b, c in zip(edges[:-1], edges[1:], counts))
+
+# Function to summarize telemetry: achieved fps, cam0-cam1 skew, schedule jitter, writer latency and stall causes
+def summarize(ev, dt=0.0):
+    cap, wr, miss = ev[ev['kind'] == CAPTURE], ev[ev['kind'] == WRITTEN], ev[ev['kind'] == MISSED]
+    out = []
+    c0, c1 = cap[cap['cam'] == 0], cap[cap['cam'] == 1]
+    # Frames of both cameras belong together when they share the scheduled slot
+    both, i0, i1 = np.intersect1d(c0['t_sched'], c1['t_sched'], return_indices=True)
+    out.append(f"{len(cap)} camera frames, {len(both)} pairs, {int(miss['flags'].sum())} missed slots, "
+               f"{int((cap['flags'] & 1).sum())} dropped frames, {int((cap['flags'] >> 1 & 1).sum())} failed captures, {len(wr)} written")
+    t = np.minimum(c0['t_host'][i0], c1['t_host'][i1])        # Pair time: first camera to start (sorted by slot)
+    gaps = np.diff(t)
+    if dt == 0.0 and len(gaps):
+        dt = float(np.median(gaps))
+    bursts = np.split(t, np.flatnonzero(gaps > 5 * dt) + 1) if len(gaps) else []
+    fps = [(len(b) - 1) / (b[-1] - b[0]) for b in bursts if len(b) > 1 and b[-1] > b[0]]
+    out.append(f"dt {dt:.4f} s ({1 / dt if dt else 0:.2f} fps nominal), {len(bursts)} bursts, achieved fps per burst: "
+               + (', '.join(f"{v:.2f}" for v in fps) or 'n/a'))
+    s0, s1 = c0['sensor_ns'][i0], c1['sensor_ns'][i1]
+    ok = (s0 > 0) & (s1 > 0)
+    skew = np.abs(s0[ok] - s1[ok]) / 1e6 if ok.any() else np.abs(c0['t_host'][i0] - c1['t_host'][i1]) * 1e3
+    out.append(f"cam0-cam1 skew ({'sensor' if ok.any() else 'host'} timestamps) ms: {percentiles(skew)}")
+    late = (cap['t_host'] - cap['t_sched']) * 1e3
+    out.append(f"wake-up lateness vs schedule ms: {percentiles(late)}")
+    out.append(histogram(late, np.array([-1, 0, 0.5, 1, 2, 5, 10, 20, 50, 1e3])))
+    if len(gaps):
+        jitter = (np.concatenate([np.diff(b) for b in bursts if len(b) > 1]) - dt) * 1e3
+        out.append(f"pair period - dt, ms: {percentiles(np.abs(jitter))}")
+        out.append(histogram(jitter, np.array([-50, -5, -1, -0.2, 0.2, 1, 5, 50, 1e3, 1e4])))
+    for cam, c in ((0, c0), (1, c1)):
+        out.append(f"cam{cam} capture_request s: {percentiles(c['d1'])}; handoff s: {percentiles(c['d2'])}; "
+                   f"queue depth max {c['depth'].max() if len(c) else 0}")
+    if len(wr):
+        out.append(f"writer queue wait s: {percentiles(wr['d1'])}; encode+write s: {percentiles(wr['d2'])}")
+    # Stall causes: why a frame was late or lost
+    causes = {'dropped (writer ring full)': int((cap['flags'] & 1).sum()),
+              'capture/save raised': int((cap['flags'] >> 1 & 1).sum()),
+              'capture_request longer than dt': int((cap['d1'] > dt).sum()) if dt else 0,
+              'handoff longer than dt': int((cap['d2'] > dt).sum()) if dt else 0,
+              'woke up > dt/2 late': int((late > dt * 500).sum()) if dt else 0,
+              'missed slots': int(miss['flags'].sum())}
+    out.append('stall causes: ' + ', '.join(f"{k} {v}" for k, v in causes.items()))
+    return '\n'.join(out)
+
+if __name__ == '__main__':
+    ev = load(sys.argv[1])
+    print(summarize(ev, float(sys.argv[2]) if len(sys.argv) > 2 else 0.0))
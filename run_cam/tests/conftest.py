@@ -0,0 +1,5 @@
+import os
+import sys
+
+os.environ.setdefault('STOKE_SIM', '1')         # Simulated cameras, buttons and VN-200 (backends.py)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
@@ -0,0 +1,40 @@
+import time
+from sim import SimPicamera2
+from capture import CaptureEngine
+
+def make_engine(tmp_path, dt):
+    cams = [SimPicamera2(0), SimPicamera2(1)]
+    [cam.configure(cam.create_still_configuration()) for cam in cams]
+    [cam.start() for cam in cams]
+    fdir = str(tmp_path) + '/'
+    return CaptureEngine(cams, dt, [fdir, fdir]), cams
+
+def test_capture_pair_fires_at_once(tmp_path):
+    dt = 2.0
+    engine, cams = make_engine(tmp_path, dt)
+    try:
+        for i in range(3):
+            t0 = time.time()
+            engine.capture_pair(i)
+            assert time.time() - t0 < dt / 4
+            assert [r[0] for r in engine.records] == [i + 1]
+            assert engine.missed == 0
+    finally:
+        engine.close()
+        [cam.close() for cam in cams]
+
+def test_burst_keeps_schedule(tmp_path):
+    dt = 0.05
+    engine, cams = make_engine(tmp_path, dt)
+    try:
+        engine.start(nframes=10)
+        t0 = time.time()
+        engine.wait()
+        sched = [r[1] for r in engine.records]
+        slots = [round((t - sched[0]) / dt) for t in sched]
+        assert len(sched) == 10 and all(abs(t - sched[0] - k * dt) < 1e-3 for t, k in zip(sched, slots))
+        assert slots[-1] == 9 + engine.missed
+        assert abs(sched[0] - t0 - dt) < dt / 2          # First slot one period after start()
+    finally:
+        engine.close()
+        [cam.close() for cam in cams]
@@ -0,0 +1,43 @@
+import os
+import time
+import threading
+import subprocess
+import numpy as np
+import pytest
+from backends import EzAsyncData
+import vnmanager as vm
+
+def start_manager(tmp_path):
+    ez = EzAsyncData.connect('/dev/ttyUSB0', 115200)
+    manager = vm.VNManager(ez, None, str(tmp_path / 'vn.state'), str(tmp_path / 'vn.sock'))
+    stop = threading.Event()
+    thread = threading.Thread(target=manager.run, args=[lambda: not stop.is_set()])
+    thread.start()
+    return manager, stop, thread
+
+def stop_manager(manager, stop, thread):
+    stop.set()
+    thread.join()
+    manager.close()
+
+def test_stale_state_file_is_not_used(tmp_path):
+    dead = subprocess.Popen(['true'])
+    dead.wait()
+    state = np.memmap(str(tmp_path / 'vn.state'), dtype=vm.state_dtype, mode='w+', shape=(1,))
+    state[0]['pid'] = dead.pid
+    state.flush()
+    with pytest.raises(TimeoutError):
+        vm.VNClient(str(tmp_path / 'vn.state'), timeout=0.2)
+
+def test_client_follows_a_restarted_manager(tmp_path):
+    running = start_manager(tmp_path)
+    client = vm.VNClient(str(tmp_path / 'vn.state'), check_dt=0)
+    assert client.wait_packets(5)
+    stop_manager(*running)
+    time.sleep(vm.stale_s + 0.1)
+    assert not client.fresh()
+    running = start_manager(tmp_path)
+    try:
+        assert client.wait_packets(5)
+    finally:
+        stop_manager(*running)
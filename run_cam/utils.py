@@ -6,7 +6,7 @@
 import os
 import time
 import yaml
-from vnpy import *
+from eventlog import get_log
 from datetime import datetime, timezone
 
 def setup_logging():
@@ -39,18 +39,28 @@ def setup_logging():
 
 def read_inputs_yaml(fname_log):
     inputs_path = '../inputs.yaml'
-    with open(fname_log, 'a') as log:
-        try:
-            with open(inputs_path, 'r') as file:
-                inputs = yaml.safe_load(file)
-            return inputs
-        except FileNotFoundError:
-            log.write(f"Error: The file {inputs_path} was not found.")
-            return None
-        except yaml.YAMLError as exc:
-            log.write(f"Error parsing YAML file: {exc}")
-            return None
+    log = get_log(fname_log)
+    try:
+        with open(inputs_path, 'r') as file:
+            inputs = yaml.safe_load(file)
+        return inputs
+    except FileNotFoundError:
+        log.event(f"Error: The file {inputs_path} was not found.")
+        return None
+    except yaml.YAMLError as exc:
+        log.event(f"Error parsing YAML file: {exc}")
+        return None
         
+# Function to free memory in MB (MemAvailable), or None off Linux
+def mem_available_mb():
+    try:
+        with open('/proc/meminfo') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        return None
+
 def create_dirs(fdir, mode):
     session = datetime.now(timezone.utc).strftime('%H%M%S_' + mode)
     fdir_out = os.path.join(fdir, session + '/')
@@ -61,43 +71,31 @@ def create_dirs(fdir, mode):
     fname_imu = f'{fdir_out}IMU_{session}.txt'
     return fdir_out, fdir_cam0, fdir_cam1, fname_imu
 
-def sync_clock_and_imu(fname_log, gps_wait_time):
-    ez = EzAsyncData.connect('/dev/ttyUSB0', 115200) # Create sensor object and connect to the VN-200 
-    s = ez.sensor                                    # at the baud rate of 115200 (115,200 bytes/s) 
-    # s = VnSensor()
-    # s.connect('/dev/ttyUSB0', 115200)
-    with open(fname_log, 'a') as log:
-        model_num = s.read_model_number()
-        serial_num = s.read_serial_number()
-        tstr = datetime.now(timezone.utc).strftime('%H%M%S%f')
-        log.write(f"{tstr}:     Connected to VN-200: Model {model_num}, Serial: {serial_num}\n")
-        log.write(f"{tstr}:     Waiting for VN-200 to acquire GPS fix...\n")
-        i = 0 
-        while ez.current_data.position_uncertainty_estimated > 10:
-            # num_sats = ez.current_data.num_sats
-            # log.write(f"Number of satellites: {num_sats}\n")
-            time.sleep(1)
-            i += 1
-            if i > gps_wait_time:
-                log.write(f"{tstr}:     VN-200 could not acquire GPS fix. Exiting.\n")
-                break
-        tstr = datetime.now(timezone.utc).strftime('%H%M%S%f')
-        if ez.current_data.has_any_position:
-            pos = ez.current_data.position_estimated_lla
-            log.write(f"{tstr}:     GPS Position (LLA): ({pos.x}, {pos.y}, {pos.z})\n")
-            posun = ez.current_data.any_position_uncertainty
-            log.write(f"{tstr}:     Position uncertainty: ({posun.x}, {posun.y}, {posun.z})\n")
-            posunes = ez.current_data.position_uncertainty_estimated
-            log.write(f"{tstr}:     Position uncertainty estimated: {posunes}\n")
-        if ez.current_data.has_time_gps:
-            vn_time = ez.current_data.time_utc
-            log.write(f"{tstr}:     Time from VN-200: {vn_time}\n")
-        if ez.current_data.has_num_sats:
-            num_sats = ez.current_data.num_sats
-            log.write(f"{tstr}:     Number of satellites: {num_sats}\n")
-        gps_sol = s.read_gps_solution_lla()
-        log.write(f"{tstr}:     GPS Solution (LLA): ({gps_sol.lla.x}, {gps_sol.lla.y}, {gps_sol.lla.z})\n")
-        imu_out = s.read_imu_measurements() 
-        log.write(f"{tstr}:     Current Temperature: {imu_out.temp} and Pressure: {imu_out.pressure}\n\n")
-    log.close()
-    s.disconnect()
\ No newline at end of file
+def sync_clock_and_imu(fname_log, gps_wait_time, vn):
+    # vn: VNClient of the VN-200 manager (vnmanager.py), which owns the serial connection
+    log = get_log(fname_log)
+    if not vn.wait_packets():
+        log.event("No data from the VN-200 manager.", blank=1)
+        return
+    st = vn.state()
+    log.event(f"Connected to VN-200: Model {st['model'].decode()}, Serial: {st['serial'].decode()}")
+    log.event("Waiting for VN-200 to acquire GPS fix...")
+    i = 0 
+    while not vn.fresh(st) or st['uncertainty'] > 10:
+        time.sleep(1)
+        i += 1
+        if i > gps_wait_time:
+            log.event("VN-200 could not acquire GPS fix. Exiting.")
+            break
+        st = vn.state()
+    imu = st['imu']
+    if st['has_position']:
+        log.event(f"GPS Position (LLA): ({imu['lla'][0]}, {imu['lla'][1]}, {imu['lla'][2]})")
+        posun = st['posu']
+        log.event(f"Position uncertainty: ({posun[0]}, {posun[1]}, {posun[2]})")
+        log.event(f"Position uncertainty estimated: {st['uncertainty']}")
+    if st['has_time']:
+        log.event(f"Time from VN-200: 20{imu['year']:02}-{imu['month']:02}-{imu['day']:02}T{imu['hour']:02}:{imu['minute']:02}:{imu['second']:02}.{imu['ms']:03}")
+    if st['num_sats']:
+        log.event(f"Number of satellites: {st['num_sats']}")
+    log.event(f"Temperature: {st['temp']:.2f} and Pressure: {st['pressure']:.2f} (read {time.time() - st['env_time']:.0f} s ago)", blank=1)
\ No newline at end of file
@@ -0,0 +1,284 @@
+# Last updated: 2026-10-17
+##################################
+# VN-200 sensor manager: the only process that opens /dev/ttyUSB0. master.py starts it once at startup; it sets the
+# sensor's asynchronous binary output (imulog.configure_async, at 1 / imu_dt Hz) and reads packets until terminated.
+#   - The latest state (GPS fix, uncertainty, satellites, time, the last IMU record, and temperature and pressure
+#     re-read from the sensor's registers every env_dt) is kept in a small memory-mapped file (state_path, in
+#     /dev/shm), updated under a sequence counter so readers never block the manager. master.py reads GPS status
+#     from it with VNClient instead of reconnecting.
+#   - Every packet, as an imulog.imu_dtype record, is streamed to subscribers on a Unix socket (sock_path). imu.py
+#     subscribes with Subscriber for the session's IMU log. A subscriber that falls behind is disconnected.
+# With STOKE_SIM=1 the port is the simulated VN-200 in sim.py.
+# Usage:
+#   python vnmanager.py <fname_log>            (started by master.py)
+#   python vnmanager.py --status               (print the current state)
+##################################
+import os
+import sys
+import time
+import errno
+import signal
+import socket
+import select
+import tempfile
+import numpy as np
+from backends import SIM, EzAsyncData
+from imulog import imu_dtype, fill_row, configure_async
+from eventlog import get_log, flush_on_signal
+
+fdir_shm = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+state_path = os.path.join(fdir_shm, 'stoke_vn200.state')
+sock_path = os.path.join(fdir_shm, 'stoke_vn200.sock')
+
+state_dtype = np.dtype([('seq', '<u8'),                     # Odd while the manager is writing
+                        ('pid', '<i4'), ('has_position', 'u1'), ('has_time', 'u1'), ('num_sats', 'u1'), ('pad', 'u1'),
+                        ('host_time', '<f8'),               # Host time of the last packet (s since epoch)
+                        ('packets', '<u8'),
+                        ('uncertainty', '<f4'),             # position_uncertainty_estimated (m)
+                        ('posu', '<f4', 3),                 # any_position_uncertainty (m)
+                        ('temp', '<f4'), ('pressure', '<f4'),
+                        ('env_time', '<f8'),                # Host time temp and pressure were read (s since epoch)
+                        ('model', 'S32'), ('serial', 'S32'),
+                        ('imu', imu_dtype)])                # Last packet
+stale_s = 2.0                           # State older than this is treated as no data
+send_timeout = 0.05                     # Subscribers that cannot take a batch within this are dropped
+
+def field(cd, attr, default=None):
+    # Attribute of a vnpy CompositeData, or default if the packet does not carry it
+    try:
+        if not getattr(cd, 'has_' + attr, True):
+            return default
+        return getattr(cd, attr)
+    except Exception:
+        return default
+
+class VNManager:
+    def __init__(self, ez, fname_log=None, state_path=state_path, sock_path=sock_path, batch_dt=0.02, env_dt=10.0):
+        self.ez = ez
+        self.s = ez.sensor
+        self.fname_log = fname_log
+        self.state_path = state_path
+        self.sock_path = sock_path
+        self.batch_dt = batch_dt                # Max time a record waits before it is sent to subscribers
+        self.env_dt = env_dt                    # Interval between temperature/pressure register reads
+        self.clients = []
+        self.dropped_clients = 0
+        self.state = np.memmap(state_path + '.tmp', dtype=state_dtype, mode='w+', shape=(1,))
+        st = self.state[0]
+        st['pid'] = os.getpid()
+        st['model'] = str(self.s.read_model_number()).encode()[:32]
+        st['serial'] = str(self.s.read_serial_number()).encode()[:32]
+        imu_out = self.s.read_imu_measurements()
+        st['temp'], st['pressure'], st['env_time'] = imu_out.temp, imu_out.pressure, time.time()
+        if os.path.exists(sock_path):
+            os.remove(sock_path)
+        self.server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.server.bind(sock_path)
+        self.server.listen(8)
+        self.server.setblocking(False)
+        os.replace(state_path + '.tmp', state_path)     # Clients wait for the state file, so it appears last
+
+    def log(self, msg, blank=0):
+        if self.fname_log:
+            get_log(self.fname_log).event(msg, blank)
+
+    def _update(self, rec, cd):
+        st = self.state[0]
+        st['seq'] += 1
+        st['imu'] = rec
+        st['host_time'] = rec['host_us'] / 1e6
+        st['packets'] += 1
+        st['has_time'] = bool(getattr(cd, 'has_time_utc', False))
+        st['has_position'] = bool(getattr(cd, 'has_any_position', False))
+        st['uncertainty'] = field(cd, 'position_uncertainty_estimated', np.inf)
+        posu = field(cd, 'any_position_uncertainty')
+        if posu is not None:
+            st['posu'] = (posu.x, posu.y, posu.z)
+        st['num_sats'] = field(cd, 'num_sats', 0)
+        st['seq'] += 1
+
+    def _read_env(self):
+        try:
+            imu_out = self.s.read_imu_measurements()
+        except Exception:                       # Keep the last values; env_time shows their age
+            return
+        st = self.state[0]
+        st['seq'] += 1
+        st['temp'], st['pressure'], st['env_time'] = imu_out.temp, imu_out.pressure, time.time()
+        st['seq'] += 1
+
+    def _accept(self):
+        while True:
+            try:
+                conn, _ = self.server.accept()
+            except (BlockingIOError, InterruptedError):
+                return
+            conn.settimeout(send_timeout)
+            self.clients.append(conn)
+
+    def _send(self, data):
+        for conn in list(self.clients):
+            try:
+                conn.sendall(data)
+            except (BrokenPipeError, ConnectionResetError):         # Unsubscribed
+                conn.close()
+                self.clients.remove(conn)
+            except OSError:                     # Too slow; a partial record would misalign its stream
+                conn.close()
+                self.clients.remove(conn)
+                self.dropped_clients += 1
+
+    def run(self, running):
+        # Read packets until running() is False. Returns the number of packets.
+        buf = np.zeros(1024, dtype=imu_dtype)
+        n, tsend = 0, time.monotonic()
+        tenv = tsend
+        while running():
+            cd = self.ez.next_data(100)         # Blocks up to 100 ms for the next packet
+            if cd is not None:
+                buf[n] = 0
+                fill_row(buf[n], int(time.time() * 1e6), cd)
+                self._update(buf[n], cd)
+                n += 1
+            if n == len(buf) or time.monotonic() - tsend > self.batch_dt:
+                self._accept()
+                if n and self.clients:
+                    self._send(buf[:n].tobytes())
+                n, tsend = 0, time.monotonic()
+            if tsend - tenv > self.env_dt:
+                self._read_env()
+                tenv = time.monotonic()
+        return int(self.state[0]['packets'])
+
+    def close(self):
+        [conn.close() for conn in self.clients]
+        self.server.close()
+        for fname in (self.sock_path, self.state_path):
+            if os.path.exists(fname):
+                os.remove(fname)
+        self.s.disconnect()
+
+def pid_alive(pid):
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+class VNClient:
+    # Reader of the manager's state. A state file left by a manager that died is not used; when a new manager
+    # replaces the file (new inode), the client maps the new one.
+    def __init__(self, state_path=state_path, timeout=10.0, check_dt=0.5):
+        self.state_path = state_path
+        self.check_dt = check_dt                # Interval between checks for a new state file
+        tend = time.time() + timeout
+        while not self._map():
+            if time.time() > tend:
+                raise TimeoutError(f"VN-200 manager not running ({state_path} not found or stale)")
+            time.sleep(0.05)
+
+    def _map(self):
+        # Map the state file if it exists and its manager is alive. Returns True if mapped.
+        try:
+            ino = os.stat(self.state_path).st_ino
+            state = np.memmap(self.state_path, dtype=state_dtype, mode='r', shape=(1,))
+        except (FileNotFoundError, ValueError):
+            return False
+        if not pid_alive(state[0]['pid']):
+            return False
+        self._state, self._ino, self._tcheck = state, ino, time.monotonic()
+        return True
+
+    def _check(self):
+        if time.monotonic() - self._tcheck < self.check_dt:
+            return
+        self._tcheck = time.monotonic()
+        try:
+            if os.stat(self.state_path).st_ino != self._ino:
+                self._map()                     # Manager restarted
+        except FileNotFoundError:
+            pass                                # Manager stopped; keep the last state (fresh() goes False)
+
+    def state(self):
+        # Consistent copy of the state (a numpy record), retried while the manager is writing it
+        self._check()
+        while True:
+            seq = int(self._state[0]['seq'])
+            st = self._state[0].copy()
+            if seq % 2 == 0 and int(self._state[0]['seq']) == seq:
+                return st
+            time.sleep(0)
+
+    def fresh(self, st=None):
+        st = self.state() if st is None else st
+        return st['packets'] > 0 and time.time() - st['host_time'] < stale_s
+
+    def wait_packets(self, timeout=10.0):
+        tend = time.time() + timeout
+        while not self.fresh():
+            if time.time() > tend:
+                return False
+            time.sleep(0.05)
+        return True
+
+class Subscriber:
+    # Stream of imu_dtype records from the manager
+    def __init__(self, sock_path=sock_path, timeout=10.0):
+        tend = time.time() + timeout
+        while True:
+            try:
+                self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                self.sock.connect(sock_path)
+                break
+            except OSError as e:
+                self.sock.close()
+                if e.errno not in (errno.ENOENT, errno.ECONNREFUSED) or time.time() > tend:
+                    raise
+                time.sleep(0.05)
+        self._rest = b''
+
+    def records(self, timeout=0.1):
+        # Records received within timeout (possibly none). Raises EOFError when the manager has closed the stream.
+        if not select.select([self.sock], [], [], timeout)[0]:
+            return np.zeros(0, dtype=imu_dtype)
+        data = self.sock.recv(1 << 16)
+        if not data:
+            raise EOFError('VN-200 manager closed the stream')
+        data = self._rest + data
+        n = len(data) // imu_dtype.itemsize
+        self._rest = data[n * imu_dtype.itemsize:]
+        return np.frombuffer(data[:n * imu_dtype.itemsize], dtype=imu_dtype)
+
+    def close(self):
+        self.sock.close()
+
+running = True
+
+def stop(signum, frame):
+    global running
+    running = False
+
+if __name__ == '__main__':
+    if sys.argv[1:] == ['--status']:
+        st = VNClient(timeout=0).state()
+        print({k: st[k].tolist() for k in state_dtype.names if k != 'imu'})
+        print({k: st['imu'][k].tolist() for k in imu_dtype.names})
+        sys.exit(0)
+    import yaml
+    fname_log = sys.argv[1]
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    flush_on_signal(signal.SIGTERM)
+    with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'inputs.yaml')) as f:
+        imu_dt = yaml.safe_load(f)['imu_dt']
+    ez = EzAsyncData.connect('/dev/ttyUSB0', 115200)   # The only connection to the VN-200
+    rate = ez.rate if SIM else configure_async(ez.sensor, 1 / imu_dt)
+    manager = VNManager(ez, fname_log)
+    manager.log(f"VN-200 manager started (pid {os.getpid()}, async output at {rate} Hz): {state_path}, {sock_path}")
+    try:
+        n = manager.run(lambda: running)
+    finally:
+        manager.close()                         # Also after a crash, so no stale state or socket file is left
+    manager.log(f"VN-200 manager stopped ({n} packets, {manager.dropped_clients} slow subscribers dropped).", blank=1)
@@ -0,0 +1,133 @@
+# Last updated: 2026-10-17
+##################################
+# Buffered frame writer: capture threads copy frames into a preallocated ring of numpy buffers and a pool of
+# encoder/writer threads turns them into JPEGs, so encoding and SD-card writes are off the capture path.
+# When every ring slot is in use the frame is dropped and counted instead of stalling the capture.
+# With sinks (one sessionfile.SessionFile per camera) frames are appended to the containers, raw or as JPEG,
+# instead of being written as individual files.
+# Given a Telemetry (telemetry.py), the queue wait and encode/write time of every frame are recorded.
+# A frame that fails to encode or write is counted in errors (per camera) and the worker carries on.
+# on_written, if set, is called with (idx, fname, image_num, t_us) after each frame is written (quicklook.py).
+##################################
+import io
+import time
+import queue
+import threading
+import numpy as np
+from PIL import Image
+from sessionfile import JPEG
+
+channels = {'RGB888': 3, 'BGR888': 3, 'XRGB8888': 4, 'XBGR8888': 4}
+
+def frame_shape(config):
+    w, h = config['main']['size']
+    return (h, w, channels.get(config['main'].get('format', 'BGR888'), 3))
+
+def encode_jpeg(frame, fmt, fname, quality=90):
+    # Picamera2's RGB888/XRGB8888 are stored B,G,R(,A) in memory; BGR888/XBGR8888 are R,G,B(,A)
+    if fmt in ('RGB888', 'XRGB8888'):
+        frame = frame[:, :, 2::-1]
+    else:
+        frame = frame[:, :, :3]
+    Image.fromarray(np.ascontiguousarray(frame)).save(fname, format='JPEG', quality=quality)
+
+def jpeg_bytes(frame, fmt, quality=90):
+    buf = io.BytesIO()
+    encode_jpeg(frame, fmt, buf, quality)
+    return buf.getvalue()
+
+class FrameWriter:
+    def __init__(self, config, nslots=16, nthreads=3, ncams=2, quality=90, sinks=None, encoding='raw', telemetry=None):
+        self.fmt = config['main'].get('format', 'BGR888')
+        self.quality = quality
+        self.sinks = sinks                      # Optional [SessionFile cam0, SessionFile cam1]
+        self.encoding = encoding                # 'raw' or 'jpeg' payloads in the sinks
+        self.telemetry = telemetry              # Optional Telemetry
+        self.ring = np.empty((nslots,) + frame_shape(config), dtype=np.uint8)    # Shared by all cameras
+        self.dropped = [0] * ncams              # Frames dropped per camera because the ring was full
+        self.written = [0] * ncams
+        self.errors = [0] * ncams               # Frames that failed to encode or write (e.g. SD card full)
+        self.last_error = None
+        self.on_written = None
+        self.max_depth = 0                      # Deepest the job queue got
+        self._free = queue.Queue()
+        [self._free.put(slot) for slot in range(nslots)]
+        self._jobs = queue.Queue(maxsize=nslots)
+        self._lock = threading.Lock()
+        self._workers = [threading.Thread(target=self._worker, daemon=True) for _ in range(nthreads)]
+        [w.start() for w in self._workers]
+
+    def depth(self):
+        return self._jobs.qsize()
+
+    def acquire(self, idx):
+        # Free ring slot for camera idx, or None (and a drop) if the writers are behind
+        try:
+            return self._free.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                self.dropped[idx] += 1
+            return None
+
+    def submit(self, idx, slot, fname, tnow, image_num):
+        self._jobs.put((idx, slot, fname, int(tnow.timestamp() * 1e6), image_num, time.time()))
+        depth = self._jobs.qsize()
+        if depth > self.max_depth:
+            self.max_depth = depth
+
+    def write_request(self, idx, request, fname, tnow, image_num):
+        # Copy the request's main buffer into the ring and queue it. Returns False if the frame was dropped.
+        slot = self.acquire(idx)
+        if slot is None:
+            return False
+        np.copyto(self.ring[slot], request.make_array('main').reshape(self.ring.shape[1:]))
+        self.submit(idx, slot, fname, tnow, image_num)
+        return True
+
+    def write_frame(self, idx, frame, fname, tnow, image_num):
+        # Queue a frame that is already in memory (pretrigger.py), waiting for a free ring slot instead of dropping it
+        slot = self._free.get()
+        np.copyto(self.ring[slot], frame)
+        self.submit(idx, slot, fname, tnow, image_num)
+
+    def _worker(self):
+        while True:
+            job = self._jobs.get()
+            if job is None:
+                return
+            idx, slot, fname, t_us, image_num, t_queued = job
+            t_start, depth = time.time(), self._jobs.qsize()
+            try:
+                if self.sinks is None:
+                    encode_jpeg(self.ring[slot], self.fmt, fname, self.quality)
+                else:
+                    if self.encoding == 'jpeg':
+                        payload = jpeg_bytes(self.ring[slot], self.fmt, self.quality)
+                        ok = self.sinks[idx].append(image_num, t_us, payload, JPEG, self.ring.shape[1:])
+                    else:
+                        ok = self.sinks[idx].append(image_num, t_us, self.ring[slot])
+                    if not ok:
+                        raise OSError(f"{self.sinks[idx].fname}: index full")
+                with self._lock:
+                    self.written[idx] += 1
+                if self.on_written:
+                    self.on_written(idx, fname, image_num, t_us)
+                if self.telemetry:
+                    t_end = time.time()
+                    self.telemetry.written(idx, image_num, t_us / 1e6, t_end, t_start - t_queued, t_end - t_start, depth)
+            except Exception as e:              # Count it and keep the worker alive for the next frame
+                with self._lock:
+                    self.errors[idx] += 1
+                    self.last_error = e
+            finally:
+                self._free.put(slot)
+                self._jobs.task_done()
+
+    def flush(self):
+        # Block until every queued frame is on disk
+        self._jobs.join()
+
+    def close(self):
+        self.flush()
+        [self._jobs.put(None) for _ in self._workers]
+        [w.join() for w in self._workers]